@@ -1,8 +1,18 @@
+import hashlib
+import threading
+import time
+from decimal import Decimal
+import orjson
+from cachetools import TTLCache
 from flask import Flask
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
+from flask_migrate import Migrate
+from sqlalchemy import event
+from werkzeug.routing import BaseConverter
 from config import Config
-from models import db
+from models import db, parse_guid
 from routes.auth import auth_bp
 from routes.frameworks import frameworks_bp
 from routes.plans import plans_bp
@@ -11,15 +21,124 @@ from routes.responses import responses_bp
 from routes.feedback import feedback_bp
 from routes.reasoning import reasoning_bp
 from routes.agent import agent_bp
-from routes.documents import documents_bp
+from routes.documents import documents_bp, UPLOAD_FOLDER
 from services.seed_data import seed_frameworks_and_prompts
+from services.knowledge_base import KnowledgeBase
+from services.ingest_jobs import fail_stale_jobs
+
+# Databases already initialized (tables created and seeded) in this process
+_initialized_databases = set()
+
+
+class CachingJWTManager(JWTManager):
+    """JWTManager that caches verified token claims briefly to skip repeated decodes.
+
+    Only signature/claims decoding is cached; blocklist and user lookup callbacks
+    still run on every request, and the `exp` claim is re-checked on cache hits.
+    """
+
+    def __init__(self, app=None, add_context_processor=False, maxsize=10000, ttl=30):
+        self._verified_tokens = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._verified_tokens_lock = threading.Lock()
+        super().__init__(app, add_context_processor)
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        if csrf_value is not None or allow_expired or not self._verified_tokens.ttl:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+        key = hashlib.sha256(encoded_token.encode()).digest()[:16]
+        with self._verified_tokens_lock:
+            claims = self._verified_tokens.get(key)
+        if claims is not None and ('exp' not in claims or claims['exp'] > time.time()):
+            return dict(claims)
+
+        claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        with self._verified_tokens_lock:
+            self._verified_tokens[key] = claims
+        return dict(claims)
+
+
+class GUIDConverter(BaseConverter):
+    """`<guid:...>` URL segment: a UUID id, canonicalized; anything else is a 404"""
+    regex = r'[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}'
+
+    def to_python(self, value):
+        return parse_guid(value)
+
+
+def _orjson_default(obj):
+    """Serialize types orjson doesn't handle natively (as Flask's default provider does)"""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson (always compact output)"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS),
+            mimetype='application/json'
+        )
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL journal and NORMAL sync: one fsync per checkpoint instead of per commit,
+    and readers no longer block on a writer (seeding, document ingestion)"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-65536")  # 64 MB page cache
+    cursor.close()
+
+
+def ensure_indexes():
+    """Create indexes added to models after their tables already existed"""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(db.engine, checkfirst=True)
+            except Exception as e:
+                print(f"Warning: Could not create index {index.name}: {e}")
+
+
+def init_db(app):
+    """Create tables, search indexes and seed data (once per database per process)"""
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if database_uri in _initialized_databases:
+        return
+    with app.app_context():
+        db.create_all()
+        ensure_indexes()
+        KnowledgeBase.ensure_threat_search_index()
+        # Seed initial frameworks and prompts
+        seed_frameworks_and_prompts()
+    _initialized_databases.add(database_uri)
+
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    app.json = OrjsonProvider(app)
+    app.url_map.converters['guid'] = GUIDConverter
     
     # Initialize extensions
     db.init_app(app)
+    Migrate(app, db)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _set_sqlite_pragmas)
     CORS(
         app,
         origins=app.config['CORS_ORIGINS'],
@@ -27,7 +146,7 @@ def create_app(config_class=Config):
         allow_headers=['Content-Type', 'Authorization'],
         methods=['GET','POST','PUT','DELETE','OPTIONS']
     )
-    jwt = JWTManager(app)
+    jwt = CachingJWTManager(app, ttl=app.config['JWT_VERIFY_CACHE_TTL'])
     
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -40,11 +159,23 @@ def create_app(config_class=Config):
     app.register_blueprint(agent_bp, url_prefix='/api/agent')
     app.register_blueprint(documents_bp, url_prefix='/api/documents')
     
-    # Create database tables
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create database tables, search indexes and seed data."""
+        init_db(app)
+        print("Database initialized")
+    
+    # Create database tables on startup unless deferred to `flask init-db`
+    if app.config['AUTO_INIT_DB']:
+        init_db(app)
+    
+    # Fail ingest jobs left unfinished by a previous process and remove their uploads
     with app.app_context():
-        db.create_all()
-        # Seed initial frameworks and prompts
-        seed_frameworks_and_prompts()
+        try:
+            fail_stale_jobs(UPLOAD_FOLDER)
+        except Exception as e:  # e.g. ingest_jobs not created yet (before `flask db upgrade`)
+            db.session.rollback()
+            print(f"Warning: Could not clean up stale ingest jobs: {e}")
     
     @app.route('/api/health')
     def health_check():
@@ -8,8 +8,32 @@ class Config:
     DATABASE_URL = os.environ.get('DATABASE_URL') or 'sqlite:///cyplanai.db'
     SQLALCHEMY_DATABASE_URI = DATABASE_URL
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Engine options: rows per multi-row INSERT batch everywhere; on PostgreSQL a larger
+    # pool, a statement timeout and (psycopg2) batched executemany for UPDATE/DELETE.
+    # The pool is per process: set DB_POOL_SIZE to the threads per worker, and keep
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) under the server's max_connections
+    # (the LangGraph server's async engine uses the same settings)
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '30000'))
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_pre_ping': True,
+        'insertmanyvalues_page_size': 1000,
+        **({
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', '20')),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '10')),
+            'pool_recycle': 1800,
+            'connect_args': {'options': f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"},
+        } if DATABASE_URL.startswith('postgresql') else {}),
+        **({
+            'executemany_mode': 'values_plus_batch',
+            'executemany_batch_page_size': 500,
+        } if DATABASE_URL.startswith(('postgresql://', 'postgresql+psycopg2://')) else {}),
+    }
+    # Create tables/seed data in create_app; set AUTO_INIT_DB=0 and run `flask init-db` once instead
+    AUTO_INIT_DB = os.environ.get('AUTO_INIT_DB', '1') == '1'
     JWT_SECRET_KEY = os.environ.get('SECRET_KEY') or SECRET_KEY
     JWT_ACCESS_TOKEN_EXPIRES = False  # Set to appropriate time in production
+    # Seconds a verified access token's claims are reused without re-decoding (0 disables)
+    JWT_VERIFY_CACHE_TTL = int(os.environ.get('JWT_VERIFY_CACHE_TTL', '30'))
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
     OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
     ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY')
@@ -21,9 +45,32 @@ class Config:
     DEEPSEEK_API_BASE = os.environ.get('DEEPSEEK_API_BASE', 'https://api.deepseek.com')
     DEEPSEEK_MODEL = os.environ.get('DEEPSEEK_MODEL', 'deepseek-chat')
     LLM_PROVIDER = os.environ.get('LLM_PROVIDER', 'openai')  # openai|anthropic|ollama|deepseek
-    CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:3000').split(',')
+    # Parsed once at import; exact (non-regex) origins are matched by plain string comparison
+    CORS_ORIGINS = [o.strip() for o in os.environ.get('CORS_ORIGINS', 'http://localhost:3000').split(',') if o.strip()]
+    # Largest accepted request body (document uploads), in MB
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_UPLOAD_MB', '100')) * 1024 * 1024
+    # Knowledge hits (library chunks + controls/threats) kept after hybrid rank fusion
+    HYBRID_TOP_K = int(os.environ.get('HYBRID_TOP_K', '5'))
+    # Seconds a knowledge base context built for a question is reused
+    KB_CONTEXT_CACHE_TTL = int(os.environ.get('KB_CONTEXT_CACHE_TTL', '300'))
+    # Generated plan summaries reused for identical or near-identical (cosine >= threshold) inputs
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.97'))
+    SEMANTIC_CACHE_TTL = int(os.environ.get('SEMANTIC_CACHE_TTL', '86400'))
+    SEMANTIC_CACHE_SIZE = int(os.environ.get('SEMANTIC_CACHE_SIZE', '512'))
+    # Concurrent embeddings API requests per process
+    EMBED_CONCURRENCY = int(os.environ.get('EMBED_CONCURRENCY', '8'))
+    # Background threads embedding uploaded documents
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', '2'))
     # Vector database configuration
     VECTOR_DB_PATH = os.environ.get('VECTOR_DB_PATH', './vector_db')
     CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', '1000'))
     CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP', '200'))
-
+    # Embedding model; EMBEDDING_DIMENSIONS shortens text-embedding-3-* vectors to cut index memory
+    EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'text-embedding-ada-002')
+    EMBEDDING_DIMENSIONS = int(os.environ['EMBEDDING_DIMENSIONS']) if os.environ.get('EMBEDDING_DIMENSIONS') else None
+    # HNSW index parameters for vector collections (applied when a collection is created)
+    HNSW_M = int(os.environ.get('HNSW_M', '32'))
+    HNSW_EF_CONSTRUCTION = int(os.environ.get('HNSW_EF_CONSTRUCTION', '80'))
+    HNSW_EF_SEARCH = int(os.environ.get('HNSW_EF_SEARCH', '40'))
+    # Max thread_id -> agent graph entries kept by the LangGraph server (least recently used evicted)
+    MAX_CACHED_GRAPHS = int(os.environ.get('MAX_CACHED_GRAPHS', '1024'))
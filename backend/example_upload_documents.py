@@ -2,47 +2,64 @@
 """
 Example script: Upload documents to knowledge base for training
 """
+import asyncio
+import httpx
 import requests
 import os
 import sys
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+from urllib3.util.retry import Retry
 
 # Configuration
 API_URL = "http://localhost:8088"
 EMAIL = "your_email@example.com"  # Replace with your email
 PASSWORD = "your_password"  # Replace with your password
 LIBRARY_NAME = "my_library"  # Library name
+UPLOAD_CONCURRENCY = 16  # Max parallel uploads in upload_directory_parallel
+SUPPORTED_EXTENSIONS = {'.pdf', '.txt', '.md', '.markdown', '.docx'}
+
+# Shared HTTP session (keep-alive connection pooling across all requests)
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20,
+                       max_retries=Retry(total=3, backoff_factor=0.3))
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
 
 def login():
-    """Login and get JWT token"""
-    response = requests.post(f"{API_URL}/api/auth/login", json={
+    """Login and get JWT token (also stored on the shared session)"""
+    response = SESSION.post(f"{API_URL}/api/auth/login", json={
         "email": EMAIL,
         "password": PASSWORD
     })
     if response.status_code == 200:
-        return response.json()["access_token"]
+        token = response.json()["access_token"]
+        SESSION.headers.update({"Authorization": f"Bearer {token}"})
+        return token
     else:
         print(f"Login failed: {response.json()}")
         sys.exit(1)
 
-def upload_file(token, file_path, library_name):
+def upload_file(file_path, library_name):
     """Upload a single file"""
-    headers = {"Authorization": f"Bearer {token}"}
     with open(file_path, 'rb') as f:
-        response = requests.post(
+        # Stream the multipart body from disk instead of building it in memory
+        encoder = MultipartEncoder(fields={
+            'library_name': library_name,
+            'file': (os.path.basename(file_path), f, 'application/octet-stream')
+        })
+        response = SESSION.post(
             f"{API_URL}/api/documents/upload",
-            headers=headers,
-            files={'file': f},
-            data={'library_name': library_name}
+            data=encoder,
+            headers={'Content-Type': encoder.content_type}
         )
     return response.json()
 
-def upload_directory(token, directory_path, library_name):
+def upload_directory(directory_path, library_name):
     """Upload all documents from directory in batch"""
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.post(
+    response = SESSION.post(
         f"{API_URL}/api/documents/upload-directory",
-        headers=headers,
         json={
             "directory_path": directory_path,
             "library_name": library_name
@@ -50,24 +67,61 @@ def upload_directory(token, directory_path, library_name):
     )
     return response.json()
 
-def list_libraries(token):
+async def upload_directory_async(files, library_name, concurrency=UPLOAD_CONCURRENCY):
+    """Upload files concurrently from the client, at most `concurrency` at a time"""
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+    headers = {"Authorization": SESSION.headers.get("Authorization", "")}
+
+    async def upload_one(client, file_path):
+        async with semaphore:
+            try:
+                with open(file_path, 'rb') as f:
+                    response = await client.post(
+                        f"{API_URL}/api/documents/upload",
+                        files={'file': (file_path.name, f)},
+                        data={'library_name': library_name}
+                    )
+                # 202: queued for processing (poll /api/documents/jobs/<jobId>); 200: already stored
+                if response.status_code in (200, 202):
+                    return file_path, response.json(), None
+                return file_path, None, response.json().get('error', 'Unknown error')
+            except Exception as e:
+                return file_path, None, str(e)
+
+    # Processing large files on the server may take a while
+    async with httpx.AsyncClient(headers=headers, limits=limits, timeout=300) as client:
+        outcomes = await asyncio.gather(*(upload_one(client, f) for f in files))
+
+    results = [data for _, data, error in outcomes if error is None]
+    errors = [{'file': str(path), 'error': error} for path, _, error in outcomes if error is not None]
+    return {
+        'successful': len(results),
+        'failed': len(errors),
+        'results': results,
+        'errors': errors
+    }
+
+def upload_directory_parallel(directory_path, library_name, concurrency=UPLOAD_CONCURRENCY):
+    """Upload all supported documents under a local directory in parallel"""
+    files = [p for p in Path(directory_path).rglob('*')
+             if p.is_file() and p.suffix.lower() in SUPPORTED_EXTENSIONS]
+    return asyncio.run(upload_directory_async(files, library_name, concurrency))
+
+def list_libraries():
     """List all libraries"""
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(
-        f"{API_URL}/api/documents/libraries",
-        headers=headers
+    response = SESSION.get(
+        f"{API_URL}/api/documents/libraries"
     )
     return response.json()
 
-def search_documents(token, query, library_name=None):
+def search_documents(query, library_name=None):
     """Search documents"""
-    headers = {"Authorization": f"Bearer {token}"}
     data = {"query": query, "n_results": 5}
     if library_name:
         data["library"] = library_name
-    response = requests.post(
+    response = SESSION.post(
         f"{API_URL}/api/documents/search",
-        headers=headers,
         json=data
     )
     return response.json()
@@ -77,14 +131,14 @@ if __name__ == "__main__":
     
     # 1. Login
     print("1. Logging in...")
-    token = login()
+    login()
     print("✓ Login successful\n")
     
     # 2. Upload single file example
     print("2. Upload single file example:")
     file_path = input("Enter file path (or press Enter to skip): ").strip()
     if file_path and os.path.exists(file_path):
-        result = upload_file(token, file_path, LIBRARY_NAME)
+        result = upload_file(file_path, LIBRARY_NAME)
         print(f"Result: {result}\n")
     else:
         print("Skipped file upload\n")
@@ -93,7 +147,7 @@ if __name__ == "__main__":
     print("3. Batch upload directory example:")
     dir_path = input("Enter directory path (or press Enter to skip): ").strip()
     if dir_path and os.path.isdir(dir_path):
-        result = upload_directory(token, dir_path, LIBRARY_NAME)
+        result = upload_directory_parallel(dir_path, LIBRARY_NAME)
         print(f"Successful: {result.get('successful', 0)} files")
         print(f"Failed: {result.get('failed', 0)} files")
         if result.get('errors'):
@@ -103,14 +157,14 @@ if __name__ == "__main__":
     
     # 4. List all libraries
     print("4. List all libraries:")
-    libraries = list_libraries(token)
+    libraries = list_libraries()
     print(f"Library list: {libraries}\n")
     
     # 5. Search example
     print("5. Search documents example:")
     query = input("Enter search query (or press Enter to skip): ").strip()
     if query:
-        results = search_documents(token, query, LIBRARY_NAME)
+        results = search_documents(query, LIBRARY_NAME)
         print(f"Found {results.get('count', 0)} results")
         for i, result in enumerate(results.get('results', []), 1):
             print(f"\nResult {i}:")
@@ -3,6 +3,9 @@ LangGraph Agent for CyPlanAI - Cybersecurity Planning Assistant
 Integrates with existing database models and knowledge base
 """
 import os
+import functools
+import hashlib
+import threading
 from typing import Annotated, TypedDict, List, Dict, Any
 from typing_extensions import Literal
 
@@ -16,18 +19,53 @@ from langgraph.graph import StateGraph, END, START
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
 from langchain_core.tools import tool
+from cachetools import TTLCache
 
+from app import create_app
 from config import Config
-from models import db, Framework, Plan, Control, Threat
+from models import db, Framework, Plan, Control, Threat, parse_guid
 from services.knowledge_base import KnowledgeBase
 from services.plan_generator import generate_plan_summary
 
 # Note: Tool functions that access database need Flask app context
 # They are defined below and wrapped in @tool decorators
 
+# Flask app shared by all tool calls (created lazily on first use)
+_flask_app = None
 
+
+def _get_flask_app():
+    """Get the shared Flask app used for database access, creating it once"""
+    global _flask_app
+    if _flask_app is None:
+        _flask_app = create_app()
+    return _flask_app
+
+
+# Maximum tokens of knowledge base context injected into the system prompt
+KB_CONTEXT_MAX_TOKENS = 400
+
+# Recent KB context per user message, so tool re-entry reuses the retrieval
+_kb_cache = TTLCache(maxsize=1024, ttl=120)
+_kb_cache_lock = threading.Lock()
+
+
+def get_kb_context(question: str) -> str:
+    """Get (truncated) knowledge base context for a question, cached briefly"""
+    key = hashlib.blake2b(question.encode(), digest_size=16).hexdigest()
+    with _kb_cache_lock:
+        kb_context = _kb_cache.get(key)
+    if kb_context is None:
+        with _get_flask_app().app_context():
+            kb_context = KnowledgeBase.get_context_for_question(question, max_tokens=KB_CONTEXT_MAX_TOKENS)
+        with _kb_cache_lock:
+            _kb_cache[key] = kb_context
+    return kb_context
+
+
+@functools.lru_cache(maxsize=1)
 def get_llm():
-    """Get the configured LLM based on environment variables"""
+    """Get the configured LLM based on environment variables (built once per process)"""
     provider = (Config.LLM_PROVIDER or 'openai').lower()
     if provider == 'openai' and Config.OPENAI_API_KEY:
         return ChatOpenAI(
@@ -69,11 +107,9 @@ class AgentState(TypedDict):
 # Define tools for the agent - these need Flask app context
 def get_framework_info_tool(framework_id: str = None) -> str:
     """Get information about a cybersecurity framework. If no framework_id is provided, returns all frameworks."""
-    from app import create_app
-    flask_app = create_app()
-    with flask_app.app_context():
+    with _get_flask_app().app_context():
         if framework_id:
-            fw = Framework.query.get(framework_id)
+            fw = db.session.get(Framework, framework_id)
             if fw:
                 return f"Framework: {fw.name} ({fw.type})\nDescription: {fw.description}\nVersion: {fw.version}"
             return f"Framework with ID {framework_id} not found."
@@ -90,18 +126,14 @@ def get_framework_info_tool(framework_id: str = None) -> str:
 
 def search_knowledge_base_tool(query: str) -> str:
     """Search the knowledge base for cybersecurity frameworks, controls, and threats. Use this for any questions about cybersecurity standards, controls, or threats."""
-    from app import create_app
-    flask_app = create_app()
-    with flask_app.app_context():
+    with _get_flask_app().app_context():
         return KnowledgeBase.get_context_for_question(query)
 
 
 def generate_plan_summary_tool_func(plan_id: str) -> str:
     """Generate a comprehensive summary for a cybersecurity plan. Requires a valid plan_id."""
-    from app import create_app
-    flask_app = create_app()
-    with flask_app.app_context():
-        plan = Plan.query.get(plan_id)
+    with _get_flask_app().app_context():
+        plan = db.session.get(Plan, plan_id) if parse_guid(plan_id) else None
         if not plan:
             return f"Plan with ID {plan_id} not found."
         
@@ -117,15 +149,8 @@ def generate_plan_summary_tool_func(plan_id: str) -> str:
 
 def get_risk_assessment_tool(keywords: str) -> str:
     """Assess risks based on keywords provided. Returns relevant threats and their risk scores."""
-    from app import create_app
-    flask_app = create_app()
-    with flask_app.app_context():
-        keywords_lower = keywords.lower()
-        threats = Threat.query.filter(
-            (Threat.name.ilike(f'%{keywords_lower}%')) |
-            (Threat.description.ilike(f'%{keywords_lower}%')) |
-            (Threat.category.ilike(f'%{keywords_lower}%'))
-        ).all()
+    with _get_flask_app().app_context():
+        threats = KnowledgeBase.search_threats(keywords)
         
         if not threats:
             return f"No threats found matching: {keywords}"
@@ -164,6 +189,26 @@ def get_risk_assessment(keywords: str) -> str:
     return get_risk_assessment_tool(keywords)
 
 
+# Tools available to the agent
+TOOLS = [
+    get_framework_info,
+    search_knowledge_base,
+    generate_plan_summary_tool,
+    get_risk_assessment
+]
+
+# Tool-bound LLM, shared across threads (created lazily)
+_llm_with_tools = None
+
+
+def _get_llm_with_tools():
+    """Get the configured LLM with the agent tools bound, creating it once"""
+    global _llm_with_tools
+    if _llm_with_tools is None:
+        _llm_with_tools = get_llm().bind_tools(TOOLS)
+    return _llm_with_tools
+
+
 # System prompt for the agent
 SYSTEM_PROMPT = """You are CyPlanAI, an expert cybersecurity planning assistant. Your role is to help users create comprehensive cybersecurity plans based on established frameworks like NIST CSF, ISO 27001, NIST AI RMF, and MITRE ATLAS.
 
@@ -182,26 +227,32 @@ Always:
 
 Start by greeting the user and asking about their cybersecurity planning goals."""
 
+# Agent prompt template, built once at import time
+AGENT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT),
+    MessagesPlaceholder(variable_name="messages"),
+])
+
+
+def _latest_user_message(messages):
+    """Latest HumanMessage, or None if there is none"""
+    return next((msg for msg in reversed(messages) if isinstance(msg, HumanMessage)), None)
+
 
 def create_agent_node(llm):
     """Create the main agent node that processes messages"""
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", SYSTEM_PROMPT),
-        MessagesPlaceholder(variable_name="messages"),
-    ])
-    
-    chain = prompt | llm
+    chain = AGENT_PROMPT | llm
     
     def agent_node(state: AgentState):
-        # Get knowledge base context for the latest user message
-        user_messages = [msg for msg in state["messages"] if isinstance(msg, HumanMessage)]
-        if user_messages:
-            latest_user_msg = user_messages[-1].content
-            kb_context = KnowledgeBase.get_context_for_question(latest_user_msg)
+        # Get knowledge base context for the latest user message (a cache hit when
+        # returning from tools, since the user message has not changed)
+        latest_user_msg = _latest_user_message(state["messages"])
+        if latest_user_msg is not None:
+            kb_context = get_kb_context(latest_user_msg.content)
             
             # Create an enhanced system message with KB context
             enhanced_system = SystemMessage(
-                content=SYSTEM_PROMPT + f"\n\nRELEVANT KNOWLEDGE BASE CONTEXT:\n{kb_context[:1500]}"
+                content=SYSTEM_PROMPT + f"\n\nRELEVANT KNOWLEDGE BASE CONTEXT:\n{kb_context}"
             )
             enhanced_messages = [enhanced_system] + state["messages"]
             enhanced_state = {**state, "messages": enhanced_messages}
@@ -216,65 +267,55 @@ def create_agent_node(llm):
 
 def should_continue(state: AgentState) -> Literal["tools", "end"]:
     """Determine whether to call tools or end"""
-    messages = state["messages"]
-    last_message = messages[-1]
+    last_message = state["messages"][-1]
     
-    # If the last message has tool calls, route to tools
-    if hasattr(last_message, "tool_calls") and last_message.tool_calls:
-        return "tools"
-    # Otherwise, end
-    return "end"
+    # If the last message has tool calls, route to tools; otherwise end
+    return "tools" if getattr(last_message, "tool_calls", None) else "end"
 
 
 def create_agent_graph(user_id: str = None, plan_id: str = None):
-    """Create and return the LangGraph agent graph"""
-    llm = get_llm()
-    
-    # Bind tools to the LLM
-    tools = [
-        get_framework_info,
-        search_knowledge_base,
-        generate_plan_summary_tool,
-        get_risk_assessment
-    ]
-    llm_with_tools = llm.bind_tools(tools)
+    """Return the LangGraph agent graph, compiling it on first use.
+
+    The graph does not depend on user_id/plan_id (they travel in the state),
+    so every (user_id, plan_id) pair shares one compiled graph.
+    """
+    return _build_agent_graph()
+
+
+@functools.lru_cache(maxsize=1)
+def _build_agent_graph():
+    """Build and compile the LangGraph agent graph (once per process)"""
+    llm_with_tools = _get_llm_with_tools()
     
     # Create agent node with tools
     def agent_node(state: AgentState):
-        # Get knowledge base context for the latest user message
-        user_messages = [msg for msg in state["messages"] if isinstance(msg, HumanMessage)]
-        kb_context = ""
-        if user_messages:
-            latest_user_msg = user_messages[-1].content
-            kb_context = KnowledgeBase.get_context_for_question(latest_user_msg)
+        messages = state["messages"]
         
-        # Create enhanced system message
-        enhanced_system = SystemMessage(
-            content=SYSTEM_PROMPT + (f"\n\nRELEVANT KNOWLEDGE BASE CONTEXT:\n{kb_context[:1500]}" if kb_context else "")
-        )
-        enhanced_messages = [enhanced_system] + state["messages"]
-        
-        # Use prompt template
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", SYSTEM_PROMPT),
-            MessagesPlaceholder(variable_name="messages"),
-        ])
+        # Single pass: drop system messages and find the latest user message
+        conversation = [None]  # system message slot, filled below
+        latest_user_msg = None
+        for msg in messages:
+            if isinstance(msg, SystemMessage):
+                continue
+            if isinstance(msg, HumanMessage):
+                latest_user_msg = msg
+            conversation.append(msg)
         
-        # Update the last system message with KB context if available
-        if kb_context:
-            messages_with_context = [
-                SystemMessage(content=SYSTEM_PROMPT + f"\n\nRELEVANT KNOWLEDGE BASE CONTEXT:\n{kb_context[:1500]}"),
-                *[msg for msg in state["messages"] if not isinstance(msg, SystemMessage)]
-            ]
-        else:
-            messages_with_context = enhanced_messages
+        # Get knowledge base context for the latest user message (a cache hit when
+        # returning from tools, since the user message has not changed)
+        system_content = SYSTEM_PROMPT
+        if latest_user_msg is not None:
+            kb_context = get_kb_context(latest_user_msg.content)
+            if kb_context:
+                system_content += f"\n\nRELEVANT KNOWLEDGE BASE CONTEXT:\n{kb_context}"
+        conversation[0] = SystemMessage(content=system_content)
         
-        response = llm_with_tools.invoke(messages_with_context)
+        response = llm_with_tools.invoke(conversation)
         
         return {"messages": [response]}
     
     # Create tool node
-    tool_node = ToolNode(tools)
+    tool_node = ToolNode(TOOLS)
     
     # Build the graph
     workflow = StateGraph(AgentState)
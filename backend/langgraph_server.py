@@ -3,21 +3,32 @@ LangGraph FastAPI Server for CyPlanAI
 Provides LangGraph API endpoints compatible with agent-chat-ui
 """
 import os
-import json
+import asyncio
+import functools
 import logging
-import hashlib
-from typing import Optional
+import uuid
+import orjson
+import xxhash
+from datetime import datetime
+from typing import Any, Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Depends, Header, Request
+import anyio
+from cachetools import LRUCache
+
+from fastapi import FastAPI, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from langgraph.graph.state import CompiledStateGraph
 from langchain_core.messages import HumanMessage, AIMessage
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import URL, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sse_starlette.sse import EventSourceResponse
 
 from app import create_app as create_flask_app
-from models import db, AgentSession, AgentMessage, ChatThread, ChatMessage
+from models import db, AgentSession, AgentMessage, ChatThread, ChatMessage, parse_guid
 from langgraph_agent import create_agent_graph, AgentState
 from config import Config
 
@@ -28,34 +39,86 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Flask app for database access
+# Initialize Flask app (creates tables, indexes and seed data on startup)
 flask_app = create_flask_app()
-flask_app.app_context().push()
+
+
+def _async_database_url(url: URL) -> URL:
+    """Map the Flask app's database URL onto the matching asyncio driver"""
+    async_drivers = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+    return url.set(drivername=async_drivers.get(url.get_backend_name(), url.drivername))
+
+
+# Pooled async engine for the request handlers, on the database the Flask app resolved
+with flask_app.app_context():
+    _database_url = _async_database_url(db.engine.url)
+# Same pool settings as the Flask app, minus the psycopg2-only executemany options; asyncpg
+# takes the statement timeout as a server setting rather than libpq's "options" string
+_engine_options = {"pool_recycle": 3600, **{
+    key: value for key, value in Config.SQLALCHEMY_ENGINE_OPTIONS.items()
+    if key not in ("connect_args", "executemany_mode", "executemany_batch_page_size")
+}}
+if _database_url.get_backend_name() == "postgresql":
+    _engine_options["connect_args"] = {
+        "server_settings": {"statement_timeout": str(Config.DB_STATEMENT_TIMEOUT_MS)}
+    }
+engine = create_async_engine(_database_url, **_engine_options)
+AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+
+
+async def get_db():
+    """Yield an AsyncSession for the duration of a request"""
+    async with AsyncSessionLocal() as session:
+        yield session
 
 # FastAPI app
-app = FastAPI(title="CyPlanAI LangGraph Server")
+app = FastAPI(title="CyPlanAI LangGraph Server", default_response_class=ORJSONResponse)
+
+
+@functools.lru_cache(maxsize=1)
+def _available_paths() -> tuple[str, ...]:
+    """Registered route paths (routes are all registered before the first request)"""
+    return tuple(r.path for r in app.routes if hasattr(r, 'path'))
+
+
+class RequestLoggingMiddleware:
+    """Pure ASGI request logging (doesn't wrap responses, so SSE streams pass straight through)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        path = scope["path"]
+        logger.info("=== Request: %s %s ===", method, path)
+        if scope.get("query_string"):
+            logger.info("Query string: %s", scope['query_string'].decode('latin-1'))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                logger.info("=== Response: %s for %s %s ===", message['status'], method, path)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except HTTPException as e:
+            logger.error("HTTP Exception %s: %s", e.status_code, e.detail)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Available routes: %s", _available_paths())
+            raise
+        except Exception as e:
+            logger.error("Exception in %s %s: %s", method, path, e)
+            import traceback
+            logger.error(traceback.format_exc())
+            raise
+
 
 # Add request logging middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logger.info(f"=== Request: {request.method} {request.url.path} ===")
-    logger.info(f"Query params: {dict(request.query_params)}")
-    logger.info(f"Path params: {request.path_params}")
-    
-    try:
-        response = await call_next(request)
-        logger.info(f"=== Response: {response.status_code} for {request.method} {request.url.path} ===")
-        return response
-    except HTTPException as e:
-        logger.error(f"HTTP Exception {e.status_code}: {e.detail}")
-        available_routes = [r.path for r in app.routes if hasattr(r, 'path')]
-        logger.error(f"Available routes: {available_routes}")
-        raise
-    except Exception as e:
-        logger.error(f"Exception in {request.method} {request.url.path}: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
-        raise
+app.add_middleware(RequestLoggingMiddleware)
 
 # CORS configuration
 app.add_middleware(
@@ -66,33 +129,186 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store agent graphs per thread (in production, use proper state management)
-agent_graphs: dict[str, CompiledStateGraph] = {}
+# Agent graphs per thread, bounded LRU (in production, use proper state management).
+# Only touched from the event loop with no await in between, so no lock is needed.
+agent_graphs: LRUCache[str, CompiledStateGraph] = LRUCache(maxsize=Config.MAX_CACHED_GRAPHS)
+
 
+class _RequestBody(BaseModel):
+    """Base for request bodies: unknown keys are dropped and dict/list payloads are
+    typed as Any so they pass through without deep validation"""
+    model_config = ConfigDict(extra='ignore', validate_assignment=False)
 
-class ThreadRequest(BaseModel):
-    config: Optional[dict] = {}
 
+class ThreadRequest(_RequestBody):
+    config: Optional[dict[str, Any]] = {}
 
-class MessageRequest(BaseModel):
-    messages: Optional[list[dict]] = None
-    config: Optional[dict] = {}
+
+class MessageRequest(_RequestBody):
+    messages: Optional[list[dict[str, Any]]] = None
+    config: Optional[dict[str, Any]] = {}
     # LangGraph SDK format support
-    input: Optional[dict] = None
-    stream_mode: Optional[list] = None
+    input: Optional[dict[str, Any]] = None
+    stream_mode: Optional[list[Any]] = None
     stream_subgraphs: Optional[bool] = None
     stream_resumable: Optional[bool] = None
     assistant_id: Optional[str] = None
     on_disconnect: Optional[str] = None
 
 
-class ThreadSearchRequest(BaseModel):
-    metadata: Optional[dict] = {}
+class ThreadSearchRequest(_RequestBody):
+    metadata: Optional[dict[str, Any]] = {}
     limit: Optional[int] = 100
     before: Optional[str] = None
     after: Optional[str] = None
 
 
+def sse_event(event: str, data: dict) -> dict:
+    """Build an SSE event for EventSourceResponse (LangGraph SDK expects JSON data)"""
+    return {"event": event, "data": orjson.dumps(data).decode()}
+
+
+def extract_text(content: str | list | dict | None) -> str:
+    """Extract plain text from message content, keeping only text blocks"""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        # Fast path: a single text block is the common shape
+        if len(content) == 1:
+            item = content[0]
+            return item.get("text", "") if isinstance(item, dict) and item.get("type") == "text" else ""
+        return " ".join(
+            item.get("text", "")
+            for item in content
+            if isinstance(item, dict) and item.get("type") == "text"
+        )
+    return str(content) if content is not None else ""
+
+
+def _render_content(content) -> str:
+    """Render non-string message content for the frontend (non-text blocks stringified)"""
+    if isinstance(content, list):
+        return " ".join(
+            item.get("text", "") if isinstance(item, dict) and item.get("type") == "text" else str(item)
+            for item in content
+        )
+    return str(content)
+
+
+def _content_hash(content_str: str, msg_type: str, idx: int) -> str:
+    """Fast non-cryptographic hash for fallback message ids, truncated to 48 bits (12 hex chars)"""
+    return f"{xxhash.xxh3_64_intdigest(f'{content_str}{msg_type}{idx}') & 0xFFFFFFFFFFFF:012x}"
+
+
+def _message_id(msg) -> str | None:
+    """LangChain id of a message, else the id the client sent with it"""
+    # id and additional_kwargs are always present on BaseMessage
+    if msg.id:
+        return str(msg.id)
+    extra = msg.additional_kwargs
+    if extra:
+        client_id = extra.get("client_message_id") or extra.get("id")
+        if client_id:
+            return str(client_id)
+    return None
+
+
+def format_langchain_messages(messages, existing_ids=None, cache: dict | None = None) -> list[dict]:
+    """Convert LangChain messages into the frontend message format.
+
+    `cache` (id(msg) -> (msg, content, idx, formatted)) lets repeated calls during a
+    stream reuse the dicts of messages whose content object has not changed.
+    """
+    formatted = []
+    append = formatted.append
+    seen = set(existing_ids or [])
+    for idx, msg in enumerate(messages):
+        if isinstance(msg, AIMessage):
+            msg_type = "ai"
+        elif isinstance(msg, HumanMessage):
+            msg_type = "human"
+        else:
+            continue
+
+        content = msg.content
+        if cache is not None:
+            entry = cache.get(id(msg))
+            if (entry is not None and entry[0] is msg and entry[1] is content
+                    and entry[2] == idx and entry[3]["id"] not in seen):
+                seen.add(entry[3]["id"])
+                append(entry[3])
+                continue
+
+        # Plain strings are the common case (streamed tokens)
+        content_str = content if isinstance(content, str) else _render_content(content)
+
+        msg_id = _message_id(msg)
+        if not msg_id or msg_id in seen:
+            content_hash = _content_hash(content_str, msg_type, idx)
+            msg_id = f"{msg_type}-{content_hash}"
+            counter = 0
+            while msg_id in seen:
+                counter += 1
+                msg_id = f"{msg_type}-{content_hash}-{counter}"
+
+        seen.add(msg_id)
+        item = {
+            "id": msg_id,
+            "type": msg_type,
+            "content": [{"type": "text", "text": content_str}],
+        }
+        if cache is not None:
+            cache[id(msg)] = (msg, content, idx, item)
+        append(item)
+    return formatted
+
+
+# Graph events buffered ahead of a slow client before the graph is paused
+STREAM_BUFFER_SIZE = 32
+_STREAM_END = object()
+
+
+async def iterate_in_task(source, maxsize: int = STREAM_BUFFER_SIZE):
+    """Drain an async iterator in its own task through a bounded queue.
+
+    The producer runs ahead of the consumer by at most `maxsize` items, and is
+    cancelled when the consumer stops early (e.g. the SSE client disconnected).
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    async def produce():
+        try:
+            async for item in source:
+                await queue.put((item, None))
+        except Exception as e:
+            await queue.put((_STREAM_END, e))
+        else:
+            await queue.put((_STREAM_END, None))
+
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _STREAM_END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        task.cancel()
+
+
+def get_config_ids(config: dict, *names: str) -> list[str | None]:
+    """The named id fields of a thread/run config (None when absent); 400 if not UUIDs"""
+    ids = []
+    for name in names:
+        value = config.get(name) or None
+        if value is not None and parse_guid(value) is None:
+            raise HTTPException(status_code=400, detail=f"Invalid {name}: expected a UUID")
+        ids.append(value)
+    return ids
+
+
 def get_thread_id_from_config(config: dict) -> str:
     """Extract thread ID from config, or generate one"""
     if "configurable" in config and "thread_id" in config["configurable"]:
@@ -121,35 +337,29 @@ async def info():
 
 
 @app.post("/threads")
-async def create_thread(request: ThreadRequest = None):
+async def create_thread(request: ThreadRequest = None, session: AsyncSession = Depends(get_db)):
     """Create a new thread for conversation"""
     logger.info("create_thread called")
     thread_id = f"thread_{os.urandom(8).hex()}"
     
     # Create agent graph for this thread
     config = request.config if request else {}
-    user_id = config.get("user_id")
-    plan_id = config.get("plan_id")
+    user_id, plan_id = get_config_ids(config, "user_id", "plan_id")
     
     agent_graph = create_agent_graph(user_id=user_id, plan_id=plan_id)
     agent_graphs[thread_id] = agent_graph
     
     # Store in database if user_id provided
     if user_id:
-        with flask_app.app_context():
-            session = AgentSession(userId=user_id, planId=plan_id)
-            db.session.add(session)
-            db.session.commit()
-            config["session_id"] = session.sessionId
-
+        agent_session = AgentSession(userId=user_id, planId=plan_id)
+        session.add(agent_session)
         # Always ensure we have a persisted chat thread record
-        chat_thread = ChatThread.query.filter_by(threadId=thread_id).first()
-        if not chat_thread:
-            chat_thread = ChatThread(threadId=thread_id, userId=user_id)
-            db.session.add(chat_thread)
-            db.session.commit()
+        if await session.scalar(select(ChatThread.id).where(ChatThread.threadId == thread_id)) is None:
+            session.add(ChatThread(threadId=thread_id, userId=user_id))
+        await session.commit()
+        config["session_id"] = agent_session.sessionId
     
-    logger.info(f"Created thread: {thread_id}")
+    logger.info("Created thread: %s", thread_id)
     return {
         "thread_id": thread_id,
         "config": config
@@ -159,7 +369,7 @@ async def create_thread(request: ThreadRequest = None):
 @app.post("/threads/search")
 async def search_threads(request: ThreadSearchRequest):
     """Search for threads (LangGraph SDK compatibility)"""
-    logger.info(f"search_threads called with metadata: {request.metadata}, limit: {request.limit}")
+    logger.info("search_threads called with metadata: %s, limit: %s", request.metadata, request.limit)
     
     # Return all threads we have in memory (for now)
     # In production, you'd query a database
@@ -175,30 +385,51 @@ async def search_threads(request: ThreadSearchRequest):
     if request.limit:
         threads = threads[:request.limit]
     
-    logger.info(f"Returning {len(threads)} threads")
+    logger.info("Returning %d threads", len(threads))
     return threads
 
 
+async def insert_chat_messages(session: AsyncSession, rows: list[dict]) -> None:
+    """Insert chat messages, skipping any (threadId, messageId) already stored"""
+    if not rows:
+        return
+    dialect = session.bind.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        stmt = dialect_insert(ChatMessage).on_conflict_do_nothing(index_elements=["threadId", "messageId"])
+        await session.execute(stmt, rows)
+        return
+    # Other databases: filter out existing ids with one query
+    existing = set(await session.scalars(
+        select(ChatMessage.messageId).where(
+            ChatMessage.threadId == rows[0]["threadId"],
+            ChatMessage.messageId.in_([row["messageId"] for row in rows]),
+        )
+    ))
+    new_rows = [row for row in rows if row["messageId"] not in existing]
+    if new_rows:
+        await session.execute(insert(ChatMessage), new_rows)
+
+
 @app.post("/threads/{thread_id}/runs")
 async def create_run(thread_id: str, request: MessageRequest):
     """Create a run (conversation turn) in a thread"""
-    logger.info(f"create_run called with thread_id: {thread_id}")
-    logger.info(f"Request data: input={request.input is not None}, messages={request.messages is not None}")
+    logger.info("create_run called with thread_id: %s", thread_id)
+    logger.info("Request data: input=%s, messages=%s", request.input is not None, request.messages is not None)
     if request.input:
-        logger.info(f"Input keys: {list(request.input.keys()) if request.input else 'None'}")
+        logger.info("Input keys: %s", list(request.input.keys()))
     if request.messages:
-        logger.info(f"Messages count: {len(request.messages)}")
+        logger.info("Messages count: %d", len(request.messages))
+    
+    config = request.config or {}
+    user_id, plan_id, session_id = get_config_ids(config, "user_id", "plan_id", "session_id")
     
-    if thread_id not in agent_graphs:
-        # Try to recreate from config if available
-        config = request.config or {}
-        user_id = config.get("user_id")
-        plan_id = config.get("plan_id")
+    agent_graph = agent_graphs.get(thread_id)
+    if agent_graph is None:
+        # Try to recreate from config if available (e.g. evicted or created by another worker)
         agent_graph = create_agent_graph(user_id=user_id, plan_id=plan_id)
         agent_graphs[thread_id] = agent_graph
     
-    agent_graph = agent_graphs[thread_id]
-    
     # Handle LangGraph SDK format (input.messages) or simple format (messages)
     messages_data = None
     if request.input and "messages" in request.input:
@@ -222,13 +453,7 @@ async def create_run(thread_id: str, request: MessageRequest):
             
             # Handle content array format from LangGraph SDK
             if isinstance(content, list):
-                # Extract text from content array
-                text_parts = []
-                for item in content:
-                    if isinstance(item, dict):
-                        if item.get("type") == "text":
-                            text_parts.append(item.get("text", ""))
-                content = " ".join(text_parts) if text_parts else ""
+                content = extract_text(content)
             
             metadata = {}
             if isinstance(msg, dict) and msg.get("id"):
@@ -240,117 +465,93 @@ async def create_run(thread_id: str, request: MessageRequest):
                 langchain_messages.append(AIMessage(content=content, additional_kwargs=metadata))
     
     # Prepare state
-    config = request.config or {}
     state: AgentState = {
         "messages": langchain_messages,
         "user_id": config.get("user_id", ""),
         "plan_id": config.get("plan_id")
     }
     
-    # Persist or refresh chat thread metadata
-    def ensure_chat_thread(user_id: str | None = None) -> ChatThread:
-        thread_record = ChatThread.query.filter_by(threadId=thread_id).first()
-        if thread_record is None:
-            thread_record = ChatThread(threadId=thread_id, userId=user_id)
-            db.session.add(thread_record)
-            db.session.commit()
-        elif user_id and not thread_record.userId:
-            thread_record.userId = user_id
-            db.session.commit()
-        return thread_record
-
-    chat_thread = ensure_chat_thread(config.get("user_id"))
-
-    def extract_text(content: str | list | dict | None) -> str:
-        if isinstance(content, str):
-            return content
-        if isinstance(content, list):
-            text_parts = []
-            for item in content:
-                if isinstance(item, dict) and item.get("type") == "text":
-                    text_parts.append(item.get("text", ""))
-            return " ".join(text_parts)
-        return str(content) if content is not None else ""
-
-    # Store the latest human message before streaming starts
-    last_message = langchain_messages[-1] if langchain_messages else None
-    if isinstance(last_message, HumanMessage):
-        human_text = extract_text(last_message.content)
-        if human_text.strip():
-            latest_db_message = ChatMessage.query.filter_by(
-                threadId=thread_id, role="human"
-            ).order_by(ChatMessage.created_at.desc()).first()
-            if not latest_db_message or latest_db_message.content != human_text:
-                db.session.add(ChatMessage(
-                    threadId=thread_id,
-                    messageId=getattr(last_message, "id", None),
-                    role="human",
-                    content=human_text,
-                ))
-                db.session.commit()
+    received_at = datetime.utcnow()
+
+    async def persist_turn(assistant_message: AIMessage | None) -> None:
+        """Persist thread metadata and this turn's messages in a single transaction"""
+        # Own session: request-scoped dependencies are closed before a streamed body finishes
+        async with AsyncSessionLocal() as session:
+            # Persist or refresh chat thread metadata
+            thread_record = await session.scalar(select(ChatThread).where(ChatThread.threadId == thread_id))
+            if thread_record is None:
+                session.add(ChatThread(threadId=thread_id, userId=user_id))
+            elif user_id and not thread_record.userId:
+                thread_record.userId = user_id
+            await session.flush()
+
+            rows = []
+            chat_rows = []
+            user_msg = langchain_messages[-1] if langchain_messages else None
+            if not isinstance(user_msg, HumanMessage):
+                user_msg = None
+            if not isinstance(assistant_message, AIMessage):
+                assistant_message = None
+
+            # Latest human message (timestamped when the request arrived). Messages
+            # without an id get a fresh one, so every turn is stored
+            if user_msg is not None:
+                human_text = extract_text(user_msg.content)
+                if human_text.strip():
+                    chat_rows.append({
+                        "threadId": thread_id,
+                        "messageId": _message_id(user_msg) or str(uuid.uuid4()),
+                        "role": "human",
+                        "content": human_text,
+                        "created_at": received_at,
+                    })
+
+            # Agent session messages if session_id is available
+            if session_id:
+                if user_msg is not None:
+                    rows.append({"sessionId": session_id, "role": "user", "content": user_msg.content})
+                if assistant_message is not None:
+                    content = assistant_message.content
+                    if isinstance(content, str) and content:
+                        rows.append({"sessionId": session_id, "role": "assistant", "content": content})
+
+            # Assistant reply for thread history
+            if assistant_message is not None:
+                assistant_text = extract_text(assistant_message.content)
+                if assistant_text.strip():
+                    chat_rows.append({
+                        "threadId": thread_id,
+                        "messageId": _message_id(assistant_message) or str(uuid.uuid4()),
+                        "role": "ai",
+                        "content": assistant_text,
+                        "created_at": datetime.utcnow(),
+                    })
+
+            await insert_chat_messages(session, chat_rows)
+            if rows:
+                await session.execute(insert(AgentMessage), rows)
+            await session.commit()
 
     # Stream the response
     async def stream_events():
+        persisted = False
         try:
-            logger.info(f"Starting to stream response for thread {thread_id}")
-            logger.info(f"User message: {langchain_messages[-1].content if langchain_messages else 'N/A'}")
+            logger.info("Starting to stream response for thread %s", thread_id)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("User message: %s", langchain_messages[-1].content if langchain_messages else 'N/A')
             
             last_assistant_message = None
-            accumulated_content = ""
+            values_scanned = 0  # Messages of the full ("values") history already checked for AIMessages
             event_count = 0
             
-            # Helper to convert LangChain messages into frontend format
-            def format_langchain_messages(messages, existing_ids=None):
-                formatted = []
-                seen = set(existing_ids or [])
-                for idx, msg in enumerate(messages):
-                    if isinstance(msg, (AIMessage, HumanMessage)):
-                        msg_type = "ai" if isinstance(msg, AIMessage) else "human"
-                        content_str = ""
-                        if isinstance(msg.content, str):
-                            content_str = msg.content
-                        elif isinstance(msg.content, list):
-                            text_parts = []
-                            for item in msg.content:
-                                if isinstance(item, dict) and item.get("type") == "text":
-                                    text_parts.append(item.get("text", ""))
-                                else:
-                                    text_parts.append(str(item))
-                            content_str = " ".join(text_parts)
-                        else:
-                            content_str = str(msg.content)
-
-                        msg_id = None
-                        if hasattr(msg, "id") and msg.id:
-                            msg_id = str(msg.id)
-                        elif hasattr(msg, "additional_kwargs") and isinstance(msg.additional_kwargs, dict):
-                            msg_id = str(
-                                msg.additional_kwargs.get("client_message_id")
-                                or msg.additional_kwargs.get("id", "")
-                            )
-
-                        if not msg_id or msg_id in seen:
-                            content_hash = hashlib.md5((content_str + msg_type + str(idx)).encode()).hexdigest()[:12]
-                            msg_id = f"{msg_type}-{content_hash}"
-                            counter = 0
-                            while msg_id in seen:
-                                counter += 1
-                                msg_id = f"{msg_type}-{content_hash}-{counter}"
-
-                        seen.add(msg_id)
-                        formatted.append({
-                            "id": msg_id,
-                            "type": msg_type,
-                            "content": [{"type": "text", "text": content_str}],
-                        })
-                return formatted
-
             all_messages_seen: list[dict] = []  # Track all messages we've seen to ensure completeness
-            async for state_update in agent_graph.astream(
+            id_to_index: dict[str, int] = {}  # Message id -> position in all_messages_seen
+            format_cache: dict[int, tuple] = {}  # Formatted dicts of unchanged messages, reused across events
+            async for state_update in iterate_in_task(agent_graph.astream(
                 state, 
                 config={"configurable": {"thread_id": thread_id}},
                 stream_mode=["values", "updates"]
-            ):
+            ), maxsize=STREAM_BUFFER_SIZE):
                 event_count += 1
                 mode = None
                 payload = state_update
@@ -359,214 +560,148 @@ async def create_run(thread_id: str, request: MessageRequest):
 
                 mode_label = mode or "unknown"
 
-                formatted_state = {}
                 raw_messages = None
-
                 if isinstance(payload, dict):
-                    if isinstance(payload.get("messages"), list):
-                        raw_messages = payload["messages"]
-                    elif isinstance(payload.get("agent"), dict) and isinstance(payload["agent"].get("messages"), list):
-                        raw_messages = payload["agent"]["messages"]
-
-                    # Capture simple scalar fields only
-                    if isinstance(payload.get("user_id"), str):
-                        formatted_state["user_id"] = payload["user_id"]
-                    if "plan_id" in payload:
-                        formatted_state["plan_id"] = payload["plan_id"]
+                    raw_messages = payload.get("messages")
+                    if raw_messages is None and isinstance(payload.get("agent"), dict):
+                        raw_messages = payload["agent"].get("messages")
+                    if not isinstance(raw_messages, list):
+                        raw_messages = None
+
+                # Nothing to send until some message has been seen
+                if raw_messages is None and not all_messages_seen:
+                    continue
 
                 if raw_messages is not None:
-                    existing_ids = [msg.get("id") for msg in all_messages_seen if isinstance(msg, dict) and msg.get("id")]
-                    formatted_messages = format_langchain_messages(raw_messages, existing_ids)
+                    # Ids already seen are not passed as taken: the same message keeps its id across events
+                    formatted_messages = format_langchain_messages(raw_messages, cache=format_cache)
 
                     if mode == "values" or not all_messages_seen:
-                        all_messages_seen = formatted_messages.copy()
+                        all_messages_seen = formatted_messages
+                        id_to_index = {msg["id"]: idx for idx, msg in enumerate(all_messages_seen)}
                     else:
-                        id_to_index = {msg.get("id"): idx for idx, msg in enumerate(all_messages_seen) if isinstance(msg, dict) and msg.get("id")}
                         for new_msg in formatted_messages:
-                            msg_id = new_msg.get("id")
+                            msg_id = new_msg["id"]
                             if msg_id in id_to_index:
                                 all_messages_seen[id_to_index[msg_id]] = new_msg
                             else:
+                                id_to_index[msg_id] = len(all_messages_seen)
                                 all_messages_seen.append(new_msg)
 
-                    formatted_state["messages"] = all_messages_seen.copy()
-
-                    for raw_msg in reversed(raw_messages):
+                    # The graph only appends, so just scan messages not seen before
+                    # ("values" carries the full history, "updates" only the delta)
+                    new_raw_messages = raw_messages[values_scanned:] if mode == "values" else raw_messages
+                    for raw_msg in new_raw_messages:
                         if isinstance(raw_msg, AIMessage):
-                            if isinstance(raw_msg.content, str):
-                                accumulated_content = raw_msg.content
-                            elif isinstance(raw_msg.content, list):
-                                text_parts = [
-                                    item.get("text", "")
-                                    for item in raw_msg.content
-                                    if isinstance(item, dict) and item.get("type") == "text"
-                                ]
-                                accumulated_content = " ".join(text_parts)
-                            else:
-                                accumulated_content = str(raw_msg.content)
                             last_assistant_message = raw_msg
-                            break
-                else:
-                    if all_messages_seen:
-                        formatted_state["messages"] = all_messages_seen.copy()
+                    if mode == "values":
+                        values_scanned = len(raw_messages)
 
-                if "messages" not in formatted_state or not formatted_state.get("messages"):
-                    continue
+                    if not all_messages_seen:
+                        continue
+
+                # No copy needed: each event is serialized before the list is mutated again
+                formatted_state = {"messages": all_messages_seen}
+
+                # Capture simple scalar fields only
+                if isinstance(payload, dict):
+                    if isinstance(payload.get("user_id"), str):
+                        formatted_state["user_id"] = payload["user_id"]
+                    if "plan_id" in payload:
+                        formatted_state["plan_id"] = payload["plan_id"]
 
                 if "user_id" not in formatted_state:
                     formatted_state["user_id"] = state.get("user_id", "")
                 if "plan_id" not in formatted_state:
                     formatted_state["plan_id"] = state.get("plan_id")
 
-                yield {
-                    "event": mode_label if mode_label in {"values", "updates"} else "data",
-                    "data": {
-                        mode_label if mode_label in {"values", "updates"} else "values": formatted_state
-                    }
-                }
+                yield sse_event(
+                    mode_label if mode_label in {"values", "updates"} else "data",
+                    {mode_label if mode_label in {"values", "updates"} else "values": formatted_state}
+                )
  
             # Get final state to ensure we have the complete response
-            if not accumulated_content or last_assistant_message is None:
+            if last_assistant_message is None or not extract_text(last_assistant_message.content):
                 logger.warning("No content accumulated, calling ainvoke to get final state...")
                 final_state = await agent_graph.ainvoke(state, config={"configurable": {"thread_id": thread_id}})
  
                 # Find last AI message
                 for msg in reversed(final_state.get("messages", [])):
                     if isinstance(msg, AIMessage):
-                        content_str = str(msg.content) if hasattr(msg, 'content') and msg.content else ""
                         last_assistant_message = msg
-                        accumulated_content = content_str
                         break
  
                 if last_assistant_message is None:
                     logger.error("❌ No AIMessage found in final state!")
                     # Log all message types
                     for i, msg in enumerate(final_state.get("messages", [])):
-                        logger.error(f"  Message {i}: {type(msg).__name__}")
+                        logger.error("  Message %d: %s", i, type(msg).__name__)
 
                 # Ensure we send the final formatted messages
                 final_formatted_messages = format_langchain_messages(final_state.get("messages", []))
                 if final_formatted_messages:
                     all_messages_seen = final_formatted_messages
-                    yield {
-                        "event": "values",
-                        "data": {
-                            "values": {
-                                "messages": final_formatted_messages,
-                                "user_id": state.get("user_id", ""),
-                                "plan_id": state.get("plan_id"),
-                            }
+                    yield sse_event("values", {
+                        "values": {
+                            "messages": final_formatted_messages,
+                            "user_id": state.get("user_id", ""),
+                            "plan_id": state.get("plan_id"),
                         }
-                    }
+                    })
  
-            # Save messages to database if session_id is available
-            session_id = config.get("session_id")
-            if session_id:
-                with flask_app.app_context():
-                    # Save user message
-                    user_msg = langchain_messages[-1] if langchain_messages else None
-                    if user_msg and isinstance(user_msg, HumanMessage):
-                        agent_msg = AgentMessage(
-                            sessionId=session_id,
-                            role="user",
-                            content=user_msg.content
-                        )
-                        db.session.add(agent_msg)
-                    
-                    # Save assistant message
-                    if last_assistant_message and isinstance(last_assistant_message, AIMessage):
-                        content = last_assistant_message.content
-                        if isinstance(content, str) and content:
-                            agent_msg = AgentMessage(
-                                sessionId=session_id,
-                                role="assistant",
-                                content=content
-                            )
-                            db.session.add(agent_msg)
-                    
-                    db.session.commit()
-
-            # Persist assistant reply for thread history
-            if last_assistant_message and isinstance(last_assistant_message, AIMessage):
-                assistant_text = extract_text(last_assistant_message.content)
-                if assistant_text.strip():
-                    latest_ai_message = ChatMessage.query.filter_by(
-                        threadId=thread_id, role="ai"
-                    ).order_by(ChatMessage.created_at.desc()).first()
-                    if not latest_ai_message or latest_ai_message.content != assistant_text:
-                        db.session.add(ChatMessage(
-                            threadId=thread_id,
-                            messageId=getattr(last_assistant_message, "id", None),
-                            role="ai",
-                            content=assistant_text,
-                        ))
-                        db.session.commit()
+            # Save the turn (thread, human/assistant messages) in one commit
+            await persist_turn(last_assistant_message)
+            persisted = True
             
             # Send final event
             if last_assistant_message and isinstance(last_assistant_message, AIMessage):
                 content = last_assistant_message.content
                 if isinstance(content, str):
-                    logger.info(f"✅ Sending final event to frontend")
-                    logger.info(f"Final content length: {len(content)} chars")
-                    logger.info(f"Final content preview: {content[:300]}...")
-            yield {
-                "event": "end",
-                "data": {}
-            }
+                    logger.info("✅ Sending final event to frontend (%d chars)", len(content))
+                    logger.debug("Final content preview: %.300s...", content)
+            yield sse_event("end", {})
         except Exception as e:
             import traceback
-            logger.error(f"Exception in stream_events: {str(e)}")
+            logger.error("Exception in stream_events: %s", e)
             traceback.print_exc()
-            yield {
-                "event": "error",
-                "data": {
-                    "error": str(e)
-                }
-            }
+            yield sse_event("error", {"error": str(e)})
+        finally:
+            # On errors and client disconnects still record the thread and the user's
+            # message (shielded: a disconnect cancels the task this generator runs in)
+            if not persisted:
+                with anyio.CancelScope(shield=True):
+                    try:
+                        await persist_turn(None)
+                    except Exception:
+                        logger.exception("Failed to persist chat turn")
     
-    from fastapi.responses import StreamingResponse
-    
-    async def generate():
-        async for event in stream_events():
-            # LangGraph SDK expects SSE format: event: <event_name>\n data: <json>\n\n
-            event_name = event.get("event", "data")
-            event_data = event.get("data", {})
-            
-            # Format as proper SSE
-            event_json_str = json.dumps(event_data)
-            sse_message = f"event: {event_name}\ndata: {event_json_str}\n\n"
-
-            logger.info(f"Sending SSE: event={event_name}, data length={len(event_json_str)}")
-            logger.debug(f"SSE Raw Message:\n{sse_message}")
-            
-            yield sse_message
-    
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    # EventSourceResponse sets no-cache/no-buffering headers and sends keep-alive pings
+    return EventSourceResponse(stream_events(), ping=15)
 
 
 @app.post("/threads/{thread_id}/runs/stream")
 async def create_run_stream(thread_id: str, request: MessageRequest):
     """Create a run with streaming response (alternative endpoint for frontend compatibility)"""
-    logger.info(f"create_run_stream called with thread_id: {thread_id}")
+    logger.info("create_run_stream called with thread_id: %s", thread_id)
     # This endpoint is the same as /runs but with /stream suffix for frontend compatibility
     return await create_run(thread_id, request)
 
 
 @app.post("/threads/{thread_id}/history")
-async def get_thread_history(thread_id: str, request: Optional[dict] = None):
+async def get_thread_history(thread_id: str, request: Optional[dict] = None, session: AsyncSession = Depends(get_db)):
     """Get thread history/state (LangGraph SDK compatibility)
     
     Returns an array of checkpoints, each containing the state at that point.
     """
-    logger.info(f"get_thread_history called with thread_id: {thread_id}")
+    logger.info("get_thread_history called with thread_id: %s", thread_id)
 
-    with flask_app.app_context():
-        chat_thread = ChatThread.query.filter_by(threadId=thread_id).first()
-        if not chat_thread:
-            logger.warning(f"Thread {thread_id} not found in database")
-            return []
+    if await session.scalar(select(ChatThread.id).where(ChatThread.threadId == thread_id)) is None:
+        logger.warning("Thread %s not found in database", thread_id)
+        return []
 
-        messages: list[ChatMessage] = ChatMessage.query.filter_by(threadId=thread_id).order_by(ChatMessage.created_at.asc()).all()
+    messages = await session.scalars(
+        select(ChatMessage).where(ChatMessage.threadId == thread_id).order_by(ChatMessage.created_at.asc())
+    )
 
     formatted_messages = []
     for msg in messages:
@@ -596,7 +731,7 @@ async def get_thread_history(thread_id: str, request: Optional[dict] = None):
 @app.get("/assistants/{assistant_id}")
 async def get_assistant(assistant_id: str):
     """Get assistant information"""
-    logger.info(f"get_assistant called with assistant_id: {assistant_id}")
+    logger.info("get_assistant called with assistant_id: %s", assistant_id)
     return {
         "assistant_id": assistant_id,
         "name": "CyPlanAI",
@@ -605,6 +740,19 @@ async def get_assistant(assistant_id: str):
 
 
 if __name__ == "__main__":
+    import importlib.util
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=2024)
+    # uvloop is not installed on Windows (see requirements.txt); "auto" falls back to asyncio
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "auto"
+    # WEB_CONCURRENCY > 1 runs several worker processes (the app is then passed by import string)
+    uvicorn.run(
+        "langgraph_server:app",
+        host="0.0.0.0",
+        port=2024,
+        loop=loop,
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY", "1")),
+        log_level="info",
+        access_log=False,  # RequestLoggingMiddleware already logs each request
+    )
 
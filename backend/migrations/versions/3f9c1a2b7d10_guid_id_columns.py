@@ -0,0 +1,136 @@
+"""Store generated UUID ids as native UUID (PostgreSQL) or 16 raw bytes (SQLite)
+
+Revision ID: 3f9c1a2b7d10
+Revises:
+Create Date: 2026-10-15 22:40:00.000000
+
+Databases created before the GUID column type hold these ids as VARCHAR(36)
+text. Columns that already use GUID (databases created by create_all since)
+are left alone, so running this on a new database only records the revision.
+
+On SQLite only the stored values are converted: SQLite keeps each value's own
+storage class and a BLOB stays a BLOB in a VARCHAR column, so the tables are
+not rebuilt. Foreign keys are not enforced there (the app does not enable
+PRAGMA foreign_keys), so parent and child ids can be converted in any order.
+"""
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c1a2b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Columns stored with the GUID type, by table
+GUID_COLUMNS = {
+    'users': ('userId',),
+    'prompts': ('promptId',),
+    'plans': ('planId', 'userId'),
+    'responses': ('responseId', 'planId', 'promptId'),
+    'feedback': ('feedbackId', 'userId', 'planId'),
+    'controls': ('controlId',),
+    'threats': ('threatId',),
+    'control_mappings': ('mappingId', 'threatId', 'controlId'),
+    'audit_logs': ('auditId', 'userId', 'planId'),
+    'agent_sessions': ('sessionId', 'userId', 'planId'),
+    'agent_messages': ('messageId', 'sessionId'),
+    'chat_threads': ('userId',),
+}
+
+
+def _guid_columns(inspector, text_ids):
+    """(table, column) pairs of GUID_COLUMNS still stored as text (text_ids) or already converted"""
+    tables = set(inspector.get_table_names())
+    pending = []
+    for table, columns in GUID_COLUMNS.items():
+        if table not in tables:
+            continue
+        types = {col['name']: col['type'] for col in inspector.get_columns(table)}
+        pending.extend(
+            (table, column) for column in columns
+            if column in types and isinstance(types[column], sa.String) == text_ids
+        )
+    return pending
+
+
+def _alter_postgresql(inspector, pending, type_, using):
+    """Change the type of the pending columns, dropping and recreating the foreign keys on them"""
+    pending_set = set(pending)
+    foreign_keys = []
+    for table in inspector.get_table_names():
+        for fk in inspector.get_foreign_keys(table):
+            if any((table, col) in pending_set for col in fk['constrained_columns']) or any(
+                (fk['referred_table'], col) in pending_set for col in fk['referred_columns']
+            ):
+                foreign_keys.append((table, fk))
+                op.drop_constraint(fk['name'], table, type_='foreignkey')
+    for table, column in pending:
+        op.alter_column(table, column, type_=type_, postgresql_using=using.format(f'"{column}"'))
+    for table, fk in foreign_keys:
+        op.create_foreign_key(
+            fk['name'], table, fk['referred_table'],
+            fk['constrained_columns'], fk['referred_columns'], **fk.get('options', {})
+        )
+
+
+def _convert_values(bind, pending, convert):
+    """Rewrite every stored value of the pending columns with convert(value)"""
+    quote = bind.dialect.identifier_preparer.quote
+    for table, column in pending:
+        table_sql, column_sql = quote(table), quote(column)
+        values = bind.execute(sa.text(
+            f"SELECT DISTINCT {column_sql} FROM {table_sql} WHERE {column_sql} IS NOT NULL"
+        )).scalars().all()
+        updates = [{'old': value, 'new': convert(value)} for value in values]
+        updates = [row for row in updates if row['new'] != row['old']]
+        if updates:
+            bind.execute(
+                sa.text(f"UPDATE {table_sql} SET {column_sql} = :new WHERE {column_sql} = :old"),
+                updates
+            )
+
+
+def _to_bytes(value):
+    return uuid.UUID(value).bytes if isinstance(value, str) else value
+
+
+def _to_text(value):
+    return str(uuid.UUID(bytes=bytes(value))) if isinstance(value, (bytes, memoryview)) else value
+
+
+def upgrade():
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    pending = _guid_columns(sa.inspect(bind), text_ids=True)
+    if not pending:
+        return
+    if dialect == 'postgresql':
+        _alter_postgresql(sa.inspect(bind), pending, postgresql.UUID(as_uuid=True), '{}::uuid')
+    elif dialect == 'sqlite':
+        _convert_values(bind, pending, _to_bytes)
+    else:
+        raise NotImplementedError(f'No VARCHAR(36) to GUID conversion for {dialect}')
+
+
+def downgrade():
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    if dialect == 'postgresql':
+        pending = _guid_columns(sa.inspect(bind), text_ids=False)
+        if pending:
+            _alter_postgresql(sa.inspect(bind), pending, sa.String(36), '{}::text')
+    elif dialect == 'sqlite':
+        # Declared types are unchanged, so convert every GUID column back to text
+        inspector = sa.inspect(bind)
+        tables = set(inspector.get_table_names())
+        _convert_values(bind, [
+            (table, column) for table, columns in GUID_COLUMNS.items() if table in tables
+            for column in columns
+        ], _to_text)
+    else:
+        raise NotImplementedError(f'No GUID to VARCHAR(36) conversion for {dialect}')
@@ -0,0 +1,44 @@
+"""Document ingest jobs table
+
+Revision ID: 8b2d4e6f1a93
+Revises: 3f9c1a2b7d10
+Create Date: 2026-10-15 23:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from models import GUID
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2d4e6f1a93'
+down_revision = '3f9c1a2b7d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_all (app startup / flask init-db) may already have created it
+    if sa.inspect(op.get_bind()).has_table('ingest_jobs'):
+        return
+    op.create_table(
+        'ingest_jobs',
+        sa.Column('jobId', GUID(), nullable=False),
+        sa.Column('userId', GUID(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('file', sa.String(length=255), nullable=False),
+        sa.Column('library', sa.String(length=255), nullable=False),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['userId'], ['users.userId']),
+        sa.PrimaryKeyConstraint('jobId'),
+    )
+    op.create_index('ix_ingestjob_status_updated', 'ingest_jobs', ['status', 'updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_ingestjob_status_updated', table_name='ingest_jobs')
+    op.drop_table('ingest_jobs')
@@ -1,15 +1,83 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerifyMismatchError
 import uuid
+from sqlalchemy import BINARY
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.types import TypeDecorator
 
 db = SQLAlchemy()
 
+# Argon2id password hashing (native code; Werkzeug hashes are upgraded on login)
+_password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+
+# to_dict() returns datetimes as-is: the orjson JSON providers (Flask and FastAPI)
+# serialize naive datetimes to the same ISO 8601 text as datetime.isoformat()
+
+
+class GUID(TypeDecorator):
+    """UUID column: native UUID on PostgreSQL, 16 raw bytes elsewhere.
+
+    Values are plain `str` in Python, so ids in JSON, JWTs and URLs are unchanged.
+    Binding a value that is not a UUID raises ValueError; validate untrusted ids
+    with parse_guid() (or the `guid` URL converter) first.
+    """
+    impl = BINARY(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(PG_UUID(as_uuid=True))
+        return dialect.type_descriptor(BINARY(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            try:
+                value = uuid.UUID(str(value))
+            except ValueError:
+                raise ValueError(f"Invalid UUID: {value!r}") from None
+        return value if dialect.name == 'postgresql' else value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return str(uuid.UUID(bytes=bytes(value)))
+        return str(value)
+
+
+def parse_guid(value):
+    """Canonical string form of a UUID id (as returned by GUID columns), or None if invalid"""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+def _cached_dict(obj, pk, build):
+    """Serialize reference data (frameworks, controls, threats) once per loaded instance.
+
+    The returned dict is shared between calls, so callers must copy it before mutating.
+    """
+    cached = obj.__dict__.get('_dict_cache')
+    if cached is None:
+        cached = build()
+        if pk is not None:  # not cached before the row is flushed and has its id
+            obj.__dict__['_dict_cache'] = cached
+    return cached
+
+
 class User(db.Model):
     """User model representing individuals using CyPlanAI"""
     __tablename__ = 'users'
     
-    userId = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    userId = db.Column(GUID(), primary_key=True, default=lambda: str(uuid.uuid4()))
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
@@ -21,10 +89,22 @@ class User(db.Model):
     plans = db.relationship('Plan', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = _password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        if not self.password_hash.startswith('$argon2'):
+            # Legacy Werkzeug (pbkdf2/scrypt) hash: verify, then upgrade it
+            if not check_password_hash(self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+        try:
+            _password_hasher.verify(self.password_hash, password)
+        except (VerifyMismatchError, InvalidHashError):
+            return False
+        if _password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     def to_dict(self):
         return {
@@ -33,7 +113,7 @@ class User(db.Model):
             'email': self.email,
             'role': self.role,
             'name': self.name,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at
         }
 
 class Framework(db.Model):
@@ -51,19 +131,19 @@ class Framework(db.Model):
     prompts = db.relationship('Prompt', backref='framework', lazy=True)
     
     def to_dict(self):
-        return {
+        return _cached_dict(self, self.frameworkId, lambda: {
             'frameworkId': self.frameworkId,
             'name': self.name,
             'type': self.type,
             'description': self.description,
             'version': self.version
-        }
+        })
 
 class Prompt(db.Model):
     """Prompt model representing questions presented to users"""
     __tablename__ = 'prompts'
     
-    promptId = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    promptId = db.Column(GUID(), primary_key=True, default=lambda: str(uuid.uuid4()))
     text = db.Column(db.Text, nullable=False)
     category = db.Column(db.String(100), nullable=False)  # e.g., 'Risk Assessment', 'Control Selection'
     frameworkId = db.Column(db.String(36), db.ForeignKey('frameworks.frameworkId'), nullable=False)
@@ -87,10 +167,10 @@ class Plan(db.Model):
     """Plan model aggregating user responses into cybersecurity planning output"""
     __tablename__ = 'plans'
     
-    planId = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    planId = db.Column(GUID(), primary_key=True, default=lambda: str(uuid.uuid4()))
     summary = db.Column(db.Text)
     status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress, completed, draft
-    userId = db.Column(db.String(36), db.ForeignKey('users.userId'), nullable=False)
+    userId = db.Column(GUID(), db.ForeignKey('users.userId'), nullable=False)
     frameworkId = db.Column(db.String(36), db.ForeignKey('frameworks.frameworkId'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -108,9 +188,9 @@ class Plan(db.Model):
             'userId': self.userId,
             'frameworkId': self.frameworkId,
             'framework': self.framework.to_dict() if self.framework else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'completed_at': self.completed_at,
             'response_count': len(self.responses)
         }
 
@@ -118,17 +198,17 @@ class Response(db.Model):
     """Response model capturing individual answers submitted by users"""
     __tablename__ = 'responses'
     
-    responseId = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    responseId = db.Column(GUID(), primary_key=True, default=lambda: str(uuid.uuid4()))
     value = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    planId = db.Column(db.String(36), db.ForeignKey('plans.planId'), nullable=False)
-    promptId = db.Column(db.String(36), db.ForeignKey('prompts.promptId'), nullable=False)
+    planId = db.Column(GUID(), db.ForeignKey('plans.planId'), nullable=False)
+    promptId = db.Column(GUID(), db.ForeignKey('prompts.promptId'), nullable=False)
     
     def to_dict(self):
         return {
             'responseId': self.responseId,
             'value': self.value,
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'timestamp': self.timestamp,
             'planId': self.planId,
             'promptId': self.promptId,
             'prompt': self.prompt.to_dict() if self.prompt else None
@@ -138,14 +218,15 @@ class Feedback(db.Model):
     """Feedback model for user feedback submissions"""
     __tablename__ = 'feedback'
     
-    feedbackId = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    userId = db.Column(db.String(36), db.ForeignKey('users.userId'), nullable=False)
-    planId = db.Column(db.String(36), db.ForeignKey('plans.planId'), nullable=True)
+    feedbackId = db.Column(GUID(), primary_key=True, default=lambda: str(uuid.uuid4()))
+    userId = db.Column(GUID(), db.ForeignKey('users.userId'), nullable=False)
+    planId = db.Column(GUID(), db.ForeignKey('plans.planId'), nullable=True)
     message = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
-    user = db.relationship('User', backref='feedback_submissions')
-    plan = db.relationship('Plan', backref='feedback')
+    # Feedback is written one row at a time and listed column-only; no backref collections
+    user = db.relationship('User', lazy='raise_on_sql')
+    plan = db.relationship('Plan', lazy='raise_on_sql')
     
     def to_dict(self):
         return {
@@ -153,7 +234,7 @@ class Feedback(db.Model):
             'userId': self.userId,
             'planId': self.planId,
             'message': self.message,
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None
+            'timestamp': self.timestamp
         }
 
 # --- Knowledge Base and Auditability ---
@@ -162,7 +243,7 @@ class Control(db.Model):
     """Catalog of controls across frameworks (normalized with citations)."""
     __tablename__ = 'controls'
 
-    controlId = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    controlId = db.Column(GUID(), primary_key=True, default=lambda: str(uuid.uuid4()))
     frameworkId = db.Column(db.String(36), db.ForeignKey('frameworks.frameworkId'), nullable=False)
     reference = db.Column(db.String(100), nullable=False)  # e.g., ISO A.8.1.1, NIST CSF PR.AC-3
     title = db.Column(db.String(255), nullable=False)
@@ -174,7 +255,7 @@ class Control(db.Model):
     framework = db.relationship('Framework')
 
     def to_dict(self):
-        return {
+        return _cached_dict(self, self.controlId, lambda: {
             'controlId': self.controlId,
             'frameworkId': self.frameworkId,
             'reference': self.reference,
@@ -183,13 +264,13 @@ class Control(db.Model):
             'category': self.category,
             'maturity_cost': self.maturity_cost,
             'severity_mitigated': self.severity_mitigated,
-        }
+        })
 
 class Threat(db.Model):
     """Threat library entries, including adversarial ML items."""
     __tablename__ = 'threats'
 
-    threatId = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    threatId = db.Column(GUID(), primary_key=True, default=lambda: str(uuid.uuid4()))
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     category = db.Column(db.String(100))  # e.g., 'Adversarial ML', 'Data Poisoning'
@@ -197,22 +278,22 @@ class Threat(db.Model):
     impact = db.Column(db.Integer, default=3)  # 1..5
 
     def to_dict(self):
-        return {
+        return _cached_dict(self, self.threatId, lambda: {
             'threatId': self.threatId,
             'name': self.name,
             'description': self.description,
             'category': self.category,
             'likelihood': self.likelihood,
             'impact': self.impact,
-        }
+        })
 
 class ControlMapping(db.Model):
     """Ontology: map risks/threats to controls and evidence."""
     __tablename__ = 'control_mappings'
 
-    mappingId = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    threatId = db.Column(db.String(36), db.ForeignKey('threats.threatId'), nullable=False)
-    controlId = db.Column(db.String(36), db.ForeignKey('controls.controlId'), nullable=False)
+    mappingId = db.Column(GUID(), primary_key=True, default=lambda: str(uuid.uuid4()))
+    threatId = db.Column(GUID(), db.ForeignKey('threats.threatId'), nullable=False)
+    controlId = db.Column(GUID(), db.ForeignKey('controls.controlId'), nullable=False)
     evidence_hint = db.Column(db.Text)  # suggested evidence to collect
 
     threat = db.relationship('Threat')
@@ -230,9 +311,9 @@ class AuditLog(db.Model):
     """Capture auditable actions and AI prompts/outputs for traceability."""
     __tablename__ = 'audit_logs'
 
-    auditId = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    userId = db.Column(db.String(36), db.ForeignKey('users.userId'))
-    planId = db.Column(db.String(36), db.ForeignKey('plans.planId'))
+    auditId = db.Column(GUID(), primary_key=True, default=lambda: str(uuid.uuid4()))
+    userId = db.Column(GUID(), db.ForeignKey('users.userId'))
+    planId = db.Column(GUID(), db.ForeignKey('plans.planId'))
     action = db.Column(db.String(100), nullable=False)  # e.g., CREATE_PLAN, GENERATE_SUMMARY
     details = db.Column(db.Text)  # JSON/text payload
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -244,34 +325,36 @@ class AuditLog(db.Model):
             'planId': self.planId,
             'action': self.action,
             'details': self.details,
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'timestamp': self.timestamp,
         }
 
 class AgentSession(db.Model):
     """Agent conversation session for stateful planning."""
     __tablename__ = 'agent_sessions'
 
-    sessionId = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    userId = db.Column(db.String(36), db.ForeignKey('users.userId'), nullable=False)
-    planId = db.Column(db.String(36), db.ForeignKey('plans.planId'), nullable=True)
+    sessionId = db.Column(GUID(), primary_key=True, default=lambda: str(uuid.uuid4()))
+    userId = db.Column(GUID(), db.ForeignKey('users.userId'), nullable=False)
+    planId = db.Column(GUID(), db.ForeignKey('plans.planId'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    plan = db.relationship('Plan')
+
     def to_dict(self):
         return {
             'sessionId': self.sessionId,
             'userId': self.userId,
             'planId': self.planId,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
         }
 
 class AgentMessage(db.Model):
     """Messages within an agent session (user/assistant/tools)."""
     __tablename__ = 'agent_messages'
 
-    messageId = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    sessionId = db.Column(db.String(36), db.ForeignKey('agent_sessions.sessionId'), nullable=False)
+    messageId = db.Column(GUID(), primary_key=True, default=lambda: str(uuid.uuid4()))
+    sessionId = db.Column(GUID(), db.ForeignKey('agent_sessions.sessionId'), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # user, assistant, tool
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
@@ -282,7 +365,7 @@ class AgentMessage(db.Model):
             'sessionId': self.sessionId,
             'role': self.role,
             'content': self.content,
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'timestamp': self.timestamp,
         }
 
 
@@ -292,22 +375,26 @@ class ChatThread(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     threadId = db.Column(db.String(64), unique=True, nullable=False, index=True)
-    userId = db.Column(db.String(36), db.ForeignKey('users.userId'), nullable=True)
+    userId = db.Column(GUID(), db.ForeignKey('users.userId'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     user = db.relationship('User', backref=db.backref('chat_threads', lazy=True))
-    messages = db.relationship('ChatMessage', backref='thread', lazy=True, cascade='all, delete-orphan', order_by='ChatMessage.created_at')
+    # Unordered (kept only for delete cascade); to_dict queries messages in created order
+    messages = db.relationship('ChatMessage', backref='thread', lazy=True, cascade='all, delete-orphan')
 
     def to_dict(self, include_messages: bool = False):
         data = {
             'threadId': self.threadId,
             'userId': self.userId,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
         }
         if include_messages:
-            data['messages'] = [message.to_dict() for message in self.messages]
+            messages = ChatMessage.query.filter_by(threadId=self.threadId).order_by(
+                ChatMessage.created_at, ChatMessage.id
+            )
+            data['messages'] = [message.to_dict() for message in messages]
         return data
 
 
@@ -331,6 +418,56 @@ class ChatMessage(db.Model):
             'role': self.role,
             'content': self.content,
             'tokenUsage': self.tokenUsage,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'created_at': self.created_at,
         }
 
+
+class IngestJob(db.Model):
+    """Background processing of an uploaded document (shared by all worker processes)."""
+    __tablename__ = 'ingest_jobs'
+
+    jobId = db.Column(GUID(), primary_key=True, default=lambda: str(uuid.uuid4()))
+    userId = db.Column(GUID(), db.ForeignKey('users.userId'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    file = db.Column(db.String(255), nullable=False)
+    library = db.Column(db.String(255), nullable=False)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        data = {
+            'jobId': self.jobId,
+            'status': self.status,
+            'userId': self.userId,
+            'file': self.file,
+            'library': self.library,
+        }
+        if self.result is not None:
+            data['result'] = self.result
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+
+# "Latest message of a role in a thread" lookups, and idempotent inserts keyed by message id
+db.Index('ix_chatmessage_thread_role_created', ChatMessage.threadId, ChatMessage.role, ChatMessage.created_at.desc())
+db.Index('uq_chatmessage_thread_message', ChatMessage.threadId, ChatMessage.messageId, unique=True)
+
+# One response per prompt per plan (also serves plan/prompt lookups)
+db.Index('uq_response_plan_prompt', Response.planId, Response.promptId, unique=True)
+
+# Foreign key + ordering columns used by list/lookup queries
+db.Index('ix_feedback_ts_id', Feedback.timestamp, Feedback.feedbackId)
+db.Index('ix_ingestjob_status_updated', IngestJob.status, IngestJob.updated_at)
+db.Index('ix_agentmsg_session_ts', AgentMessage.sessionId, AgentMessage.timestamp)
+db.Index('ix_audit_plan_ts', AuditLog.planId, AuditLog.timestamp)
+db.Index('ix_ctrlmap_threat', ControlMapping.threatId)
+db.Index('ix_ctrlmap_control', ControlMapping.controlId)
+
+# Natural keys of catalog rows, so seeding can skip rows that already exist
+db.Index('uq_control_framework_ref', Control.frameworkId, Control.reference, unique=True)
+db.Index('uq_prompt_framework_order', Prompt.frameworkId, Prompt.order, unique=True)
+db.Index('uq_threat_name', Threat.name, unique=True)
+db.Index('uq_ctrlmap_threat_control', ControlMapping.threatId, ControlMapping.controlId, unique=True)
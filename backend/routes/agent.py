@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from services.agent_service import AgentService
-from models import AgentSession
+from models import AgentSession, parse_guid
 
 agent_bp = Blueprint('agent', __name__)
 
@@ -11,6 +11,8 @@ agent_bp = Blueprint('agent', __name__)
 def start_session():
     user_id = get_jwt_identity()
     plan_id = (request.get_json() or {}).get('planId')
+    if plan_id is not None and parse_guid(plan_id) is None:
+        return jsonify({'error': 'Invalid planId'}), 400
     service = AgentService(user_id)
     session = service.start_session(plan_id)
     return jsonify({'session': session.to_dict(), 'llm': {
@@ -19,7 +21,7 @@ def start_session():
     }}), 201
 
 
-@agent_bp.route('/session/<session_id>/message', methods=['POST'])
+@agent_bp.route('/session/<guid:session_id>/message', methods=['POST'])
 @jwt_required()
 def session_message(session_id):
     user_id = get_jwt_identity()
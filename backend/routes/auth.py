@@ -53,6 +53,10 @@ def login():
     if not user or not user.check_password(data['password']):
         return jsonify({'error': 'Invalid credentials'}), 401
     
+    # Persist a password hash upgraded by check_password
+    if db.session.is_modified(user):
+        db.session.commit()
+    
     access_token = create_access_token(identity=user.userId)
     
     return jsonify({
@@ -66,7 +70,7 @@ def login():
 def get_current_user():
     """Get current authenticated user"""
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = db.session.get(User, user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -3,24 +3,42 @@ Document Management Routes - Upload and manage library documents for RAG
 """
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+import hashlib
 import os
+import shutil
+import tempfile
 from werkzeug.utils import secure_filename
 from pathlib import Path
-from services.document_loader import DocumentLoader
+from services.document_loader import get_document_loader
+from services.ingest_jobs import submit_document, get_job
 
 documents_bp = Blueprint('documents', __name__)
 
-# Allowed file extensions
-ALLOWED_EXTENSIONS = {'pdf', 'txt', 'md', 'markdown', 'docx'}
+# Allowed file extensions (as returned by os.path.splitext)
+ALLOWED_EXTENSIONS = frozenset({'.pdf', '.txt', '.md', '.markdown', '.docx'})
+
+# Chunks embedded and stored per batch by upload_directory
+INGEST_BATCH_SIZE = 500
 
 # Upload directory
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 
-def allowed_file(filename):
+def allowed_file(filename: str) -> bool:
     """Check if file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def save_upload(stream, file_path):
+    """Write an uploaded stream to file_path, returning its BLAKE2b content hash"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'wb', buffering=0) as fh:
+        # Copy in 1 MB chunks, hashing as we go
+        for block in iter(lambda: stream.read(1024 * 1024), b''):
+            digest.update(block)
+            fh.write(block)
+    return digest.hexdigest()
 
 
 @documents_bp.route('/upload', methods=['POST'])
@@ -37,39 +55,50 @@ def upload_document():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        if not allowed_file(file.filename):
+        # Sanitize first so the extension check sees the name that is actually saved
+        filename = secure_filename(file.filename)
+        if not allowed_file(filename):
             return jsonify({
-                'error': f'File type not allowed. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
+                'error': f'File type not allowed. Allowed types: {", ".join(ext[1:] for ext in sorted(ALLOWED_EXTENSIONS))}'
             }), 400
         
-        # Save file temporarily
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-        
-        try:
-            # Process and store document
-            doc_loader = DocumentLoader()
-            result = doc_loader.process_and_store(file_path, library_name=library_name)
-            
-            # Clean up uploaded file after processing
-            os.remove(file_path)
-            
+        # Save file temporarily, in its own directory so concurrent uploads of the
+        # same name do not collide while queued
+        file_path = os.path.join(tempfile.mkdtemp(dir=UPLOAD_FOLDER), filename)
+        content_hash = save_upload(file.stream, file_path)
+        
+        # Identical bytes already embedded into this library: skip the whole pipeline
+        if get_document_loader().has_document(content_hash, library_name):
+            shutil.rmtree(os.path.dirname(file_path), ignore_errors=True)
             return jsonify({
-                'message': 'Document uploaded and processed successfully',
-                'data': result
+                'message': 'Document already processed',
+                'duplicate': True,
+                'data': {'library': library_name, 'file': filename, 'content_hash': content_hash}
             }), 200
         
-        except Exception as e:
-            # Clean up on error
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return jsonify({'error': f'Error processing document: {str(e)}'}), 500
+        # Embedding can take tens of seconds; process it in the background
+        job_id = submit_document(file_path, library_name, get_jwt_identity(), content_hash)
+        
+        return jsonify({
+            'message': 'Document queued for processing',
+            'jobId': job_id,
+            'status': 'queued'
+        }), 202
     
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
 
+@documents_bp.route('/jobs/<guid:job_id>', methods=['GET'])
+@jwt_required()
+def get_upload_job(job_id):
+    """Get the status (queued/running/completed/failed) of a document upload job"""
+    job = get_job(job_id)
+    if job is None or job.get('userId') != get_jwt_identity():
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
+
 @documents_bp.route('/upload-directory', methods=['POST'])
 @jwt_required()
 def upload_directory():
@@ -85,22 +114,46 @@ def upload_directory():
         if not os.path.isdir(directory_path):
             return jsonify({'error': 'Invalid directory path'}), 400
         
-        # Process all supported files in directory
-        doc_loader = DocumentLoader()
+        # Process all supported files in directory (single recursive walk),
+        # embedding and storing chunks across files in fixed-size batches
+        doc_loader = get_document_loader()
         results = []
         errors = []
+        buffer = []
+        pending = []  # (file_path, result) whose chunks are in buffer
+        
+        def flush():
+            try:
+                doc_loader.bulk_store(buffer)
+                results.extend(result for _, result in pending)
+            except Exception as e:
+                errors.extend({'file': str(path), 'error': str(e)} for path, _ in pending)
+            buffer.clear()
+            pending.clear()
         
-        for ext in ALLOWED_EXTENSIONS:
-            pattern = f"**/*.{ext}"
-            for file_path in Path(directory_path).glob(pattern):
-                try:
-                    result = doc_loader.process_and_store(str(file_path), library_name=library_name)
-                    results.append(result)
-                except Exception as e:
-                    errors.append({
-                        'file': str(file_path),
-                        'error': str(e)
-                    })
+        # os.walk classifies entries from the directory listing, so filtering by
+        # extension first needs no per-file stat
+        supported_files = (
+            Path(root) / name
+            for root, _, file_names in os.walk(directory_path)
+            for name in file_names
+            if allowed_file(name)
+        )
+        for file_path in supported_files:
+            try:
+                result = doc_loader.process(str(file_path), library_name=library_name)
+            except Exception as e:
+                errors.append({
+                    'file': str(file_path),
+                    'error': str(e)
+                })
+                continue
+            buffer.extend(result['chunks'])
+            pending.append((file_path, {**result, 'chunks': len(result['chunks'])}))
+            if len(buffer) >= INGEST_BATCH_SIZE:
+                flush()
+        if pending:
+            flush()
         
         return jsonify({
             'message': f'Processed {len(results)} documents',
@@ -119,7 +172,7 @@ def upload_directory():
 def list_libraries():
     """List all libraries in the vector database"""
     try:
-        doc_loader = DocumentLoader()
+        doc_loader = get_document_loader()
         libraries = doc_loader.get_all_libraries()
         return jsonify({
             'libraries': libraries,
@@ -134,7 +187,7 @@ def list_libraries():
 def delete_library(library_name):
     """Delete all documents from a library"""
     try:
-        doc_loader = DocumentLoader()
+        doc_loader = get_document_loader()
         success = doc_loader.delete_library(library_name)
         if success:
             return jsonify({
@@ -159,7 +212,7 @@ def search_documents():
         if not query:
             return jsonify({'error': 'query is required'}), 400
         
-        doc_loader = DocumentLoader()
+        doc_loader = get_document_loader()
         results = doc_loader.search(query=query, n_results=n_results, library_filter=library_filter)
         
         return jsonify({
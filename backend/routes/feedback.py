@@ -1,10 +1,15 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Feedback
+from models import db, Feedback, parse_guid
 from datetime import datetime
+from sqlalchemy import and_, or_, select
 
 feedback_bp = Blueprint('feedback', __name__)
 
+# Page sizes for the feedback listing
+FEEDBACK_PAGE_SIZE = 50
+FEEDBACK_MAX_PAGE_SIZE = 200
+
 @feedback_bp.route('', methods=['POST'])
 @jwt_required()
 def submit_feedback():
@@ -24,10 +29,14 @@ def submit_feedback():
     if len(message) == 0:
         return jsonify({'error': 'Feedback message cannot be empty'}), 400
     
+    plan_id = data.get('planId')
+    if plan_id is not None and parse_guid(plan_id) is None:
+        return jsonify({'error': 'Invalid planId'}), 400
+    
     # Create feedback
     feedback = Feedback(
         userId=user_id,
-        planId=data.get('planId'),
+        planId=plan_id,
         message=message,
         timestamp=datetime.utcnow()
     )
@@ -46,12 +55,42 @@ def get_feedback():
     """Get feedback (admin/instructor only - for future use)"""
     user_id = get_jwt_identity()
     from models import User
-    user = User.query.get(user_id)
+    user = db.session.get(User, user_id)
     
     # Only allow admin/instructor to view all feedback
     if user.role not in ['admin', 'instructor']:
         return jsonify({'error': 'Unauthorized access'}), 403
     
-    feedback_list = Feedback.query.order_by(Feedback.timestamp.desc()).all()
-    return jsonify([f.to_dict() for f in feedback_list]), 200
+    # Keyset pagination: newest first by (timestamp, feedbackId); pass next_before and
+    # next_before_id back as ?before=&before_id= for the next page
+    try:
+        limit = min(max(int(request.args.get('limit', FEEDBACK_PAGE_SIZE)), 1), FEEDBACK_MAX_PAGE_SIZE)
+        before = request.args.get('before')
+        before = datetime.fromisoformat(before) if before else None
+        before_id = request.args.get('before_id')
+        if before_id is not None and parse_guid(before_id) is None:
+            raise ValueError(before_id)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit, before or before_id parameter'}), 400
+    
+    # Plain column rows (same keys as Feedback.to_dict()); no ORM instances to build
+    query = select(
+        Feedback.feedbackId, Feedback.userId, Feedback.planId, Feedback.message, Feedback.timestamp
+    ).order_by(Feedback.timestamp.desc(), Feedback.feedbackId.desc())
+    if before and before_id:
+        # Rows sharing the boundary timestamp continue after the boundary id
+        query = query.where(or_(
+            Feedback.timestamp < before,
+            and_(Feedback.timestamp == before, Feedback.feedbackId < before_id)
+        ))
+    elif before:
+        query = query.where(Feedback.timestamp < before)
+    feedback_list = [dict(row) for row in db.session.execute(query.limit(limit)).mappings()]
+    
+    last = feedback_list[-1] if len(feedback_list) == limit else None
+    return jsonify({
+        'items': feedback_list,
+        'next_before': last['timestamp'].isoformat() if last else None,
+        'next_before_id': last['feedbackId'] if last else None
+    }), 200
 
@@ -1,22 +1,64 @@
+import threading
+from cachetools import TTLCache
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from models import db, Framework, Control
+from models import db, Framework, Control, Prompt
 from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import raiseload, selectinload
 
 frameworks_bp = Blueprint('frameworks', __name__)
 
+# Encoded JSON bodies of framework responses; dropped whenever Framework/Prompt/Control
+# rows are written in this process (the TTL bounds staleness from other processes)
+_framework_cache = TTLCache(maxsize=256, ttl=300)
+_framework_cache_lock = threading.Lock()
+
+
+def _cached_json(key, build):
+    """Return a JSON response for key, building and encoding it once on a miss (None if build() is None)"""
+    with _framework_cache_lock:
+        body = _framework_cache.get(key)
+    if body is None:
+        value = build()
+        if value is None:
+            return None
+        body = current_app.json.dumps(value)
+        with _framework_cache_lock:
+            _framework_cache[key] = body
+    return current_app.response_class(body, mimetype='application/json')
+
+
+def invalidate_framework_cache():
+    """Drop cached framework responses (run on every Framework/Prompt/Control write)"""
+    with _framework_cache_lock:
+        _framework_cache.clear()
+
+
+def _invalidate_framework_cache(mapper, connection, target):
+    invalidate_framework_cache()
+
+
+for _model in (Framework, Prompt, Control):
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, _invalidate_framework_cache)
+
 @frameworks_bp.route('', methods=['GET'])
 @jwt_required()
 def get_frameworks():
     """Get all available cybersecurity frameworks"""
-    frameworks = Framework.query.order_by(Framework.name).all()
-    return jsonify([f.to_dict() for f in frameworks]), 200
+    def build():
+        # to_dict() is column-only; fail loudly if it ever starts lazy-loading relationships
+        frameworks = Framework.query.options(raiseload('*')).order_by(Framework.name).all()
+        return [f.to_dict() for f in frameworks]
+
+    return _cached_json('frameworks:list', build), 200
 
 @frameworks_bp.route('/<framework_id>', methods=['GET'])
 @jwt_required()
 def get_framework(framework_id):
     """Get specific framework details"""
-    framework = Framework.query.get(framework_id)
+    framework = db.session.get(Framework, framework_id)
     
     if not framework:
         return jsonify({'error': 'Framework not found'}), 404
@@ -27,24 +69,34 @@ def get_framework(framework_id):
 @jwt_required()
 def get_framework_info(framework_id):
     """Get detailed framework information including controls and guidance"""
-    framework = Framework.query.get(framework_id)
+    def build():
+        # Load prompts with the framework (prompt.framework then resolves from the identity map)
+        framework = db.session.get(Framework, framework_id, options=[selectinload(Framework.prompts)])
+        if not framework:
+            return None
+        
+        # Enhanced framework info with prompts count
+        info = dict(framework.to_dict())  # to_dict() is shared; copy before adding keys
+        info['prompts_count'] = len(framework.prompts)
+        info['prompts'] = [p.to_dict() for p in sorted(framework.prompts, key=lambda x: x.order)]
+        info['llm_provider'] = current_app.config.get('LLM_PROVIDER', 'openai')
+        info['llm_model'] = current_app.config.get('OPENAI_MODEL') or current_app.config.get('ANTHROPIC_MODEL') or current_app.config.get('OLLAMA_MODEL')
+        return info
     
-    if not framework:
+    response = _cached_json(('frameworks:info', framework_id), build)
+    if response is None:
         return jsonify({'error': 'Framework not found'}), 404
     
-    # Enhanced framework info with prompts count
-    info = framework.to_dict()
-    info['prompts_count'] = len(framework.prompts)
-    info['prompts'] = [p.to_dict() for p in sorted(framework.prompts, key=lambda x: x.order)]
-    info['llm_provider'] = current_app.config.get('LLM_PROVIDER', 'openai')
-    info['llm_model'] = current_app.config.get('OPENAI_MODEL') or current_app.config.get('ANTHROPIC_MODEL') or current_app.config.get('OLLAMA_MODEL')
-    
-    return jsonify(info), 200
+    return response, 200
 
 @frameworks_bp.route('/<framework_id>/controls', methods=['GET'])
 @jwt_required()
 def get_framework_controls(framework_id):
     """List normalized controls for a framework."""
-    ctrls = Control.query.filter_by(frameworkId=framework_id).all()
-    return jsonify([c.to_dict() for c in ctrls]), 200
+    # Plain column rows (same keys as Control.to_dict()); no ORM instances to build
+    query = select(
+        Control.controlId, Control.frameworkId, Control.reference, Control.title,
+        Control.description, Control.category, Control.maturity_cost, Control.severity_mitigated
+    ).where(Control.frameworkId == framework_id)
+    return jsonify([dict(row) for row in db.session.execute(query).mappings()]), 200
 
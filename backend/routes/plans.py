@@ -1,17 +1,38 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response as FlaskResponse, request, jsonify, send_file, stream_with_context, json
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, Plan, Framework, Response, Prompt
+import tempfile
 from datetime import datetime
-from services.plan_generator import generate_plan_summary
+from services.plan_generator import generate_plan_summary, stream_plan_summary
+from sqlalchemy import exists
+from sqlalchemy.orm import selectinload
 
 plans_bp = Blueprint('plans', __name__)
 
+# PDF exports larger than this are spooled to a temporary file
+PDF_SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def _get_plan_with_prompts(plan_id):
+    """Load a plan with its responses, framework and framework prompts in a fixed number of queries"""
+    return db.session.get(Plan, plan_id, options=[
+        selectinload(Plan.responses),
+        selectinload(Plan.framework).selectinload(Framework.prompts)
+    ])
+
+
+def _framework_prompts(plan):
+    """Prompts of the plan's framework in display order (already loaded by _get_plan_with_prompts)"""
+    return sorted(plan.framework.prompts, key=lambda p: p.order) if plan.framework else []
+
 @plans_bp.route('', methods=['GET'])
 @jwt_required()
 def get_plans():
     """Get all plans for the current user"""
     user_id = get_jwt_identity()
-    plans = Plan.query.filter_by(userId=user_id).order_by(Plan.created_at.desc()).all()
+    plans = Plan.query.options(
+        selectinload(Plan.framework), selectinload(Plan.responses)
+    ).filter_by(userId=user_id).order_by(Plan.created_at.desc()).all()
     return jsonify([p.to_dict() for p in plans]), 200
 
 @plans_bp.route('', methods=['POST'])
@@ -24,7 +45,7 @@ def create_plan():
     if not data or not data.get('frameworkId'):
         return jsonify({'error': 'Framework ID is required'}), 400
     
-    framework = Framework.query.get(data['frameworkId'])
+    framework = db.session.get(Framework, data['frameworkId'])
     if not framework:
         return jsonify({'error': 'Framework not found'}), 404
     
@@ -40,12 +61,12 @@ def create_plan():
     
     return jsonify(plan.to_dict()), 201
 
-@plans_bp.route('/<plan_id>', methods=['GET'])
+@plans_bp.route('/<guid:plan_id>', methods=['GET'])
 @jwt_required()
 def get_plan(plan_id):
     """Get specific plan details"""
     user_id = get_jwt_identity()
-    plan = Plan.query.get(plan_id)
+    plan = _get_plan_with_prompts(plan_id)
     
     if not plan:
         return jsonify({'error': 'Plan not found'}), 404
@@ -58,17 +79,17 @@ def get_plan(plan_id):
     plan_dict['responses'] = [r.to_dict() for r in plan.responses]
     
     # Get prompts for this framework
-    prompts = Prompt.query.filter_by(frameworkId=plan.frameworkId).order_by(Prompt.order).all()
+    prompts = _framework_prompts(plan)
     plan_dict['prompts'] = [p.to_dict() for p in prompts]
     
     return jsonify(plan_dict), 200
 
-@plans_bp.route('/<plan_id>/resume', methods=['GET'])
+@plans_bp.route('/<guid:plan_id>/resume', methods=['GET'])
 @jwt_required()
 def resume_plan(plan_id):
     """Resume a planning session - get next unanswered prompt"""
     user_id = get_jwt_identity()
-    plan = Plan.query.get(plan_id)
+    plan = db.session.get(Plan, plan_id, options=[selectinload(Plan.framework), selectinload(Plan.responses)])
     
     if not plan:
         return jsonify({'error': 'Plan not found'}), 404
@@ -76,18 +97,11 @@ def resume_plan(plan_id):
     if plan.userId != user_id:
         return jsonify({'error': 'Unauthorized access'}), 403
     
-    # Get all prompts for this framework
-    prompts = Prompt.query.filter_by(frameworkId=plan.frameworkId).order_by(Prompt.order).all()
-    
-    # Get already answered prompt IDs
-    answered_prompt_ids = {r.promptId for r in plan.responses}
-    
-    # Find next unanswered prompt
-    next_prompt = None
-    for prompt in prompts:
-        if prompt.promptId not in answered_prompt_ids:
-            next_prompt = prompt
-            break
+    # Find next unanswered prompt in the database (uses uq_response_plan_prompt)
+    answered = exists().where(Response.planId == plan.planId, Response.promptId == Prompt.promptId)
+    next_prompt = Prompt.query.filter(
+        Prompt.frameworkId == plan.frameworkId, ~answered
+    ).order_by(Prompt.order).first()
     
     if not next_prompt:
         # All prompts answered, return completion status
@@ -104,54 +118,99 @@ def resume_plan(plan_id):
         'completed': False
     }), 200
 
-@plans_bp.route('/<plan_id>/generate-summary', methods=['POST'])
-@jwt_required()
-def generate_summary(plan_id):
-    """Generate summary plan from all responses"""
+def _load_plan_for_summary(plan_id):
+    """Load the current user's plan and its prompts, checking every prompt is answered.
+
+    Returns (plan, prompts, None) or (None, None, error response).
+    """
     user_id = get_jwt_identity()
-    plan = Plan.query.get(plan_id)
+    plan = _get_plan_with_prompts(plan_id)
     
     if not plan:
-        return jsonify({'error': 'Plan not found'}), 404
+        return None, None, (jsonify({'error': 'Plan not found'}), 404)
     
     if plan.userId != user_id:
-        return jsonify({'error': 'Unauthorized access'}), 403
+        return None, None, (jsonify({'error': 'Unauthorized access'}), 403)
     
     # Get all prompts for this framework
-    prompts = Prompt.query.filter_by(frameworkId=plan.frameworkId).order_by(Prompt.order).all()
+    prompts = _framework_prompts(plan)
     answered_prompt_ids = {r.promptId for r in plan.responses}
     
     # Validate all prompts are answered
     prompt_ids = {p.promptId for p in prompts}
     if prompt_ids != answered_prompt_ids:
-        return jsonify({
+        return None, None, (jsonify({
             'error': 'All prompts must be answered before generating summary',
             'missing_prompts': len(prompt_ids - answered_prompt_ids)
-        }), 400
-    
-    # Generate plan summary using AI
-    responses = plan.responses
-    summary = generate_plan_summary(plan, prompts, responses)
+        }), 400)
     
+    return plan, prompts, None
+
+
+def _complete_plan(plan, summary):
     plan.summary = summary
     plan.status = 'completed'
     plan.completed_at = datetime.utcnow()
-    
     db.session.commit()
+
+
+@plans_bp.route('/<guid:plan_id>/generate-summary', methods=['POST'])
+@jwt_required()
+def generate_summary(plan_id):
+    """Generate summary plan from all responses"""
+    plan, prompts, error = _load_plan_for_summary(plan_id)
+    if error:
+        return error
+    
+    # Generate plan summary using AI
+    summary = generate_plan_summary(plan, prompts, plan.responses)
+    _complete_plan(plan, summary)
     
     return jsonify({
         'plan': plan.to_dict(),
         'summary': summary
     }), 200
 
-@plans_bp.route('/<plan_id>/export', methods=['GET'])
+@plans_bp.route('/<guid:plan_id>/generate-summary/stream', methods=['POST'])
+@jwt_required()
+def stream_summary(plan_id):
+    """Generate the plan summary, streaming it as Server-Sent Events.
+
+    Sends `chunk` events ({"text": ...}) as the LLM writes, then one `done` event
+    with the completed plan (or an `error` event, in which case nothing is saved).
+    """
+    plan, prompts, error = _load_plan_for_summary(plan_id)
+    if error:
+        return error
+    
+    def events():
+        parts = []
+        try:
+            for text in stream_plan_summary(plan, prompts, plan.responses):
+                parts.append(text)
+                yield f"event: chunk\ndata: {json.dumps({'text': text})}\n\n"
+            _complete_plan(plan, "".join(parts))
+        except Exception as e:
+            db.session.rollback()
+            yield f"event: error\ndata: {json.dumps({'error': f'Summary generation failed: {str(e)}'})}\n\n"
+            return
+        yield f"event: done\ndata: {json.dumps({'plan': plan.to_dict()})}\n\n"
+    
+    return FlaskResponse(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@plans_bp.route('/<guid:plan_id>/export', methods=['GET'])
 @jwt_required()
 def export_plan(plan_id):
     """Export plan as PDF or JSON"""
     from services.export_service import export_plan_to_pdf, export_plan_to_json
     
     user_id = get_jwt_identity()
-    plan = Plan.query.get(plan_id)
+    # Responses' prompts (and their framework) then resolve from the identity map
+    plan = _get_plan_with_prompts(plan_id)
     
     if not plan:
         return jsonify({'error': 'Plan not found'}), 404
@@ -162,12 +221,13 @@ def export_plan(plan_id):
     format_type = request.args.get('format', 'json').lower()
     
     if format_type == 'pdf':
-        pdf_data = export_plan_to_pdf(plan)
-        from flask import Response
-        return Response(
-            pdf_data,
+        # Large PDFs spill to disk and are sent in blocks rather than held in memory
+        pdf_file = export_plan_to_pdf(plan, tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_SIZE))
+        return send_file(
+            pdf_file,
             mimetype='application/pdf',
-            headers={'Content-Disposition': f'attachment; filename=plan_{plan.planId}.pdf'}
+            as_attachment=True,
+            download_name=f'plan_{plan.planId}.pdf'
         )
     else:
         json_data = export_plan_to_json(plan)
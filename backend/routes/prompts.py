@@ -1,6 +1,6 @@
 from flask import Blueprint, jsonify
 from flask_jwt_extended import jwt_required
-from models import Prompt
+from models import db, Prompt
 
 prompts_bp = Blueprint('prompts', __name__)
 
@@ -11,11 +11,11 @@ def get_prompts_by_framework(framework_id):
     prompts = Prompt.query.filter_by(frameworkId=framework_id).order_by(Prompt.order).all()
     return jsonify([p.to_dict() for p in prompts]), 200
 
-@prompts_bp.route('/<prompt_id>', methods=['GET'])
+@prompts_bp.route('/<guid:prompt_id>', methods=['GET'])
 @jwt_required()
 def get_prompt(prompt_id):
     """Get specific prompt details"""
-    prompt = Prompt.query.get(prompt_id)
+    prompt = db.session.get(Prompt, prompt_id)
     
     if not prompt:
         return jsonify({'error': 'Prompt not found'}), 404
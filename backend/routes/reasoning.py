@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import Threat, ControlMapping
+from collections import defaultdict
+from models import Threat, ControlMapping, parse_guid
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload, raiseload
 
 reasoning_bp = Blueprint('reasoning', __name__)
 
@@ -18,14 +21,32 @@ def risk_score():
     data = request.get_json() or {}
     items = data.get('threats', [])
 
+    # Resolve every referenced threat, and all their mappings, in two queries
+    threat_ids = {parse_guid(item['threatId']) for item in items if item.get('threatId')} - {None}
+    names = {item['name'] for item in items if not item.get('threatId') and item.get('name')}
+    threats_by_id, threats_by_name = {}, {}
+    if threat_ids or names:
+        for t in Threat.query.options(raiseload('*')).filter(
+            or_(Threat.threatId.in_(list(threat_ids)), Threat.name.in_(list(names)))
+        ):
+            threats_by_id[t.threatId] = t
+            threats_by_name.setdefault(t.name, t)
+
+    mappings_by_threat = defaultdict(list)
+    if threats_by_id:
+        for m in ControlMapping.query.options(
+            joinedload(ControlMapping.control), raiseload('*')
+        ).filter(ControlMapping.threatId.in_(list(threats_by_id))):
+            mappings_by_threat[m.threatId].append(m)
+
     results = []
     for item in items:
         # Accept by name or id
         t = None
         if item.get('threatId'):
-            t = Threat.query.filter_by(threatId=item['threatId']).first()
+            t = threats_by_id.get(parse_guid(item['threatId']))
         elif item.get('name'):
-            t = Threat.query.filter_by(name=item['name']).first()
+            t = threats_by_name.get(item['name'])
 
         if not t:
             continue
@@ -34,9 +55,8 @@ def risk_score():
         i = item.get('impact', t.impact or 3)
         s = score(l, i)
 
-        mappings = ControlMapping.query.filter_by(threatId=t.threatId).all()
         controls = []
-        for m in mappings:
+        for m in mappings_by_threat[t.threatId]:
             c = m.control
             if not c:
                 continue
@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Response, Plan, Prompt
+from models import db, Response, Plan, Prompt, parse_guid
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 from services.response_validator import validate_response
 
 responses_bp = Blueprint('responses', __name__)
@@ -16,8 +17,11 @@ def submit_response():
     if not data or not data.get('planId') or not data.get('promptId') or not data.get('value'):
         return jsonify({'error': 'Missing required fields: planId, promptId, value'}), 400
     
+    if parse_guid(data['planId']) is None or parse_guid(data['promptId']) is None:
+        return jsonify({'error': 'Invalid planId or promptId'}), 400
+    
     # Validate plan exists and belongs to user
-    plan = Plan.query.get(data['planId'])
+    plan = db.session.get(Plan, data['planId'])
     if not plan:
         return jsonify({'error': 'Plan not found'}), 404
     
@@ -25,7 +29,7 @@ def submit_response():
         return jsonify({'error': 'Unauthorized access'}), 403
     
     # Validate prompt exists and belongs to the plan's framework
-    prompt = Prompt.query.get(data['promptId'])
+    prompt = db.session.get(Prompt, data['promptId'])
     if not prompt:
         return jsonify({'error': 'Prompt not found'}), 404
     
@@ -59,16 +63,30 @@ def submit_response():
     )
     
     db.session.add(response)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent submission created it first (uq_response_plan_prompt); update that one
+        db.session.rollback()
+        existing_response = Response.query.filter_by(
+            planId=data['planId'],
+            promptId=data['promptId']
+        ).first()
+        if not existing_response:
+            raise
+        existing_response.value = data['value']
+        existing_response.timestamp = datetime.utcnow()
+        db.session.commit()
+        return jsonify(existing_response.to_dict()), 200
     
     return jsonify(response.to_dict()), 201
 
-@responses_bp.route('/plan/<plan_id>', methods=['GET'])
+@responses_bp.route('/plan/<guid:plan_id>', methods=['GET'])
 @jwt_required()
 def get_responses_by_plan(plan_id):
     """Get all responses for a specific plan"""
     user_id = get_jwt_identity()
-    plan = Plan.query.get(plan_id)
+    plan = db.session.get(Plan, plan_id)
     
     if not plan:
         return jsonify({'error': 'Plan not found'}), 404
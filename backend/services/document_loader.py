@@ -2,20 +2,37 @@
 Document Loader Service - Loads and processes documents for vectorization
 Supports PDF, Markdown, TXT, DOCX formats
 """
+import hashlib
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
+from cachetools import LRUCache
 from pathlib import Path
 import chromadb
 from chromadb.config import Settings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
-from langchain_core.documents import Document
-import pypdf
-import markdown
+import pypdfium2 as pdfium
 from docx import Document as DocxDocument
 
 from config import Config
 
+# Texts per embeddings request, and chunks per ChromaDB add()
+EMBED_BATCH_SIZE = 96
+STORE_BATCH_SIZE = 500
+
+# Query embeddings kept (by SHA-256 of the query text); the model is fixed per process
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+_query_embedding_cache = LRUCache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+_query_embedding_cache_lock = threading.Lock()
+
+# Serializes PDFium calls (the library keeps global state)
+_pdfium_lock = threading.Lock()
+
+# Embedding requests are network-bound; overlap them across a small shared pool
+_embedding_executor = ThreadPoolExecutor(max_workers=Config.EMBED_CONCURRENCY, thread_name_prefix='embed')
+
 
 class DocumentLoader:
     """Load and process documents for vectorization"""
@@ -33,20 +50,14 @@ class DocumentLoader:
             # DeepSeek does not provide embedding API, so we use OpenAI embeddings
             # This is the standard approach when using DeepSeek for chat
             if Config.OPENAI_API_KEY:
-                self.embeddings = OpenAIEmbeddings(
-                    openai_api_key=Config.OPENAI_API_KEY,
-                    model="text-embedding-ada-002"
-                )
+                self.embeddings = self._create_embeddings()
             else:
                 raise Exception(
                     "When using DeepSeek, you must also set OPENAI_API_KEY for embeddings. "
                     "DeepSeek does not provide embedding service."
                 )
         elif Config.OPENAI_API_KEY:
-            self.embeddings = OpenAIEmbeddings(
-                openai_api_key=Config.OPENAI_API_KEY,
-                model="text-embedding-ada-002"
-            )
+            self.embeddings = self._create_embeddings()
         else:
             raise Exception("No embedding API key available. Please set OPENAI_API_KEY.")
         
@@ -56,34 +67,59 @@ class DocumentLoader:
             path=Config.VECTOR_DB_PATH,
             settings=Settings(anonymized_telemetry=False)
         )
+        hnsw_metadata = {
+            "hnsw:space": "cosine",
+            "hnsw:M": Config.HNSW_M,
+            "hnsw:construction_ef": Config.HNSW_EF_CONSTRUCTION,
+            "hnsw:search_ef": Config.HNSW_EF_SEARCH,
+        }
         self.collection = self.client.get_or_create_collection(
             name="library_documents",
-            metadata={"hnsw:space": "cosine"}
+            metadata=hnsw_metadata
+        )
+        # HNSW index over threat library entries for semantic risk lookup
+        self.threat_collection = self.client.get_or_create_collection(
+            name="threats",
+            metadata=hnsw_metadata
+        )
+    
+    @staticmethod
+    def _create_embeddings() -> OpenAIEmbeddings:
+        """Create the OpenAI embedder (optionally with reduced output dimensions)"""
+        kwargs = {}
+        if Config.EMBEDDING_DIMENSIONS:
+            # Only supported by text-embedding-3-* models
+            kwargs["dimensions"] = Config.EMBEDDING_DIMENSIONS
+        return OpenAIEmbeddings(
+            openai_api_key=Config.OPENAI_API_KEY,
+            model=Config.EMBEDDING_MODEL,
+            **kwargs
         )
     
     def load_pdf(self, file_path: str) -> str:
         """Load text from PDF file"""
-        text = ""
+        pages = []
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = pypdf.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
+            # PDFium is not thread-safe; uploads may be processed on several threads
+            with _pdfium_lock:
+                pdf = pdfium.PdfDocument(file_path)
+                try:
+                    for page in pdf:
+                        textpage = page.get_textpage()
+                        pages.append(textpage.get_text_bounded().replace("\r\n", "\n"))
+                        textpage.close()
+                        page.close()
+                finally:
+                    pdf.close()
         except Exception as e:
             raise Exception(f"Error loading PDF: {str(e)}")
-        return text
+        return "".join(page + "\n" for page in pages)
     
     def load_markdown(self, file_path: str) -> str:
-        """Load text from Markdown file"""
+        """Load text from Markdown file (kept as-is; embeddings handle markdown syntax fine)"""
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                # Convert markdown to plain text (remove markdown syntax)
-                html = markdown.markdown(content)
-                # Simple HTML to text conversion (basic)
-                import re
-                text = re.sub(r'<[^>]+>', '', html)
-                return text
+                return file.read()
         except Exception as e:
             raise Exception(f"Error loading Markdown: {str(e)}")
     
@@ -120,52 +156,111 @@ class DocumentLoader:
         else:
             raise ValueError(f"Unsupported file format: {ext}")
     
-    def process_and_store(self, file_path: str, library_name: str = "default") -> Dict[str, Any]:
-        """Process document and store in vector database"""
+    def process(self, file_path: str, library_name: str = "default",
+                content_hash: str = None) -> Dict[str, Any]:
+        """Load and split a document into chunks ready for bulk_store (no embedding yet)"""
         # Load document
         text = self.load_document(file_path)
         
-        # Split into chunks
-        documents = self.text_splitter.create_documents([text])
+        # Split into chunks (plain strings; no intermediate Document objects)
+        texts = self.text_splitter.split_text(text)
         
-        # Add metadata
+        # Add metadata (per-document fields built once; only chunk_index varies)
         file_name = Path(file_path).name
-        for i, doc in enumerate(documents):
-            doc.metadata = {
-                "source": file_name,
-                "library": library_name,
-                "chunk_index": i,
-                "total_chunks": len(documents)
+        base_metadata = {"source": file_name, "library": library_name, "total_chunks": len(texts)}
+        if content_hash:
+            base_metadata["content_hash"] = content_hash
+        id_prefix = f"{library_name}_{file_name}_"
+        chunks = [
+            {
+                "id": f"{id_prefix}{i}",
+                "text": chunk_text,
+                "metadata": {**base_metadata, "chunk_index": i}
             }
-        
-        # Generate embeddings and store
-        texts = [doc.page_content for doc in documents]
-        metadatas = [doc.metadata for doc in documents]
-        ids = [f"{library_name}_{file_name}_{i}" for i in range(len(documents))]
-        
-        # Get embeddings
-        embeddings_list = self.embeddings.embed_documents(texts)
-        
-        # Store in ChromaDB
-        self.collection.add(
-            embeddings=embeddings_list,
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
-        )
+            for i, chunk_text in enumerate(texts)
+        ]
         
         return {
             "status": "success",
             "library": library_name,
             "file": file_name,
-            "chunks": len(documents),
+            "chunks": chunks,
             "total_chars": len(text)
         }
     
+    def bulk_store(self, chunks: List[Dict[str, Any]]) -> int:
+        """Embed chunks (from one or more documents) and store them in ChromaDB.
+
+        Embedding requests run concurrently in batches; vectors are written to
+        ChromaDB in order as they arrive, STORE_BATCH_SIZE chunks per add().
+        """
+        if not chunks:
+            return 0
+        texts = [chunk["text"] for chunk in chunks]
+        batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+        
+        start = 0
+        pending = []
+        for vectors in _embedding_executor.map(self.embeddings.embed_documents, batches):
+            pending.extend(vectors)
+            if len(pending) >= STORE_BATCH_SIZE:
+                self._add_chunks(chunks[start:start + len(pending)], pending)
+                start += len(pending)
+                pending = []
+        if pending:
+            self._add_chunks(chunks[start:], pending)
+        return len(chunks)
+    
+    def _add_chunks(self, chunks: List[Dict[str, Any]], embeddings: List[List[float]]):
+        """Store already-embedded chunks in ChromaDB"""
+        self.collection.add(
+            embeddings=embeddings,
+            documents=[chunk["text"] for chunk in chunks],
+            metadatas=[chunk["metadata"] for chunk in chunks],
+            ids=[chunk["id"] for chunk in chunks]
+        )
+    
+    def process_and_store(self, file_path: str, library_name: str = "default",
+                          content_hash: str = None) -> Dict[str, Any]:
+        """Process document and store in vector database"""
+        result = self.process(file_path, library_name=library_name, content_hash=content_hash)
+        self.bulk_store(result["chunks"])
+        return {**result, "chunks": len(result["chunks"])}
+    
+    def has_document(self, content_hash: str, library_name: str) -> bool:
+        """Check whether a file with this content hash is already stored in the library"""
+        results = self.collection.get(
+            where={"$and": [{"content_hash": content_hash}, {"library": library_name}]},
+            limit=1,
+            include=[]
+        )
+        return bool(results['ids'])
+    
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """Embed query texts, reusing cached vectors; misses go out in one embeddings request"""
+        keys = [hashlib.sha256(q.encode('utf-8')).hexdigest() for q in queries]
+        with _query_embedding_cache_lock:
+            vectors = [_query_embedding_cache.get(key) for key in keys]
+        missing = {key: q for key, q, v in zip(keys, queries, vectors) if v is None}
+        if missing:
+            fresh = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            with _query_embedding_cache_lock:
+                _query_embedding_cache.update(fresh)
+            vectors = [v if v is not None else fresh[key] for key, v in zip(keys, vectors)]
+        return vectors
+    
     def search(self, query: str, n_results: int = 5, library_filter: str = None) -> List[Dict[str, Any]]:
         """Search documents using vector similarity"""
-        # Generate query embedding
-        query_embedding = self.embeddings.embed_query(query)
+        return self.batch_search([query], n_results=n_results, library_filter=library_filter)[query]
+    
+    def batch_search(self, queries: List[str], n_results: int = 5,
+                     library_filter: str = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Search documents for several queries with one embeddings request and one ChromaDB query"""
+        queries = list(dict.fromkeys(queries))
+        if not queries:
+            return {}
+        # Generate query embeddings
+        query_embeddings = self.embed_queries(queries)
         
         # Build where clause for filtering
         where = {}
@@ -174,26 +269,56 @@ class DocumentLoader:
         
         # Search in ChromaDB
         results = self.collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=query_embeddings,
             n_results=n_results,
             where=where if where else None
         )
         
         # Format results
-        formatted_results = []
-        if results['documents'] and len(results['documents'][0]) > 0:
-            for i in range(len(results['documents'][0])):
-                formatted_results.append({
-                    "content": results['documents'][0][i],
-                    "metadata": results['metadatas'][0][i] if results['metadatas'] else {},
-                    "distance": results['distances'][0][i] if results['distances'] else None
-                })
+        formatted = {}
+        for q, query in enumerate(queries):
+            formatted_results = []
+            if results['documents'] and len(results['documents'][q]) > 0:
+                for i in range(len(results['documents'][q])):
+                    formatted_results.append({
+                        "content": results['documents'][q][i],
+                        "metadata": results['metadatas'][q][i] if results['metadatas'] else {},
+                        "distance": results['distances'][q][i] if results['distances'] else None
+                    })
+            formatted[query] = formatted_results
         
-        return formatted_results
+        return formatted
+    
+    def index_threats(self, threats) -> int:
+        """Embed threats (name, description, category) and upsert them into the threat index"""
+        if not threats:
+            return 0
+        texts = [f"{t.name} {t.description or ''} {t.category or ''}" for t in threats]
+        self.threat_collection.upsert(
+            ids=[t.threatId for t in threats],
+            embeddings=self.embeddings.embed_documents(texts),
+            documents=texts
+        )
+        return len(threats)
+    
+    def search_threats(self, query: str, n_results: int = 10) -> List[Dict[str, Any]]:
+        """Search the threat index, returning threat IDs ordered by similarity"""
+        results = self.threat_collection.query(
+            query_embeddings=self.embed_queries([query]),
+            n_results=n_results
+        )
+        if not results['ids'] or not results['ids'][0]:
+            return []
+        distances = results['distances'][0] if results['distances'] else [None] * len(results['ids'][0])
+        return [
+            {"threatId": threat_id, "distance": distance}
+            for threat_id, distance in zip(results['ids'][0], distances)
+        ]
     
     def get_all_libraries(self) -> List[str]:
         """Get list of all libraries in the database"""
-        results = self.collection.get()
+        # Only metadata is needed; skip transferring documents
+        results = self.collection.get(include=["metadatas"])
         libraries = set()
         if results['metadatas']:
             for meta in results['metadatas']:
@@ -204,14 +329,24 @@ class DocumentLoader:
     def delete_library(self, library_name: str) -> bool:
         """Delete all documents from a specific library"""
         try:
-            # Get all documents from this library
-            results = self.collection.get(
-                where={"library": library_name}
-            )
-            if results['ids']:
-                self.collection.delete(ids=results['ids'])
+            # Single filtered delete; no need to fetch the ids first
+            self.collection.delete(where={"library": library_name})
             return True
         except Exception as e:
             print(f"Error deleting library: {str(e)}")
             return False
 
+
+# Process-wide loader (embedding client + Chroma collections), created on first use
+_document_loader = None
+_document_loader_lock = threading.Lock()
+
+
+def get_document_loader() -> DocumentLoader:
+    """Get the shared DocumentLoader, creating it once (raises if embeddings are not configured)"""
+    global _document_loader
+    if _document_loader is None:
+        with _document_loader_lock:
+            if _document_loader is None:
+                _document_loader = DocumentLoader()
+    return _document_loader
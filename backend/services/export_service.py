@@ -7,9 +7,11 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from io import BytesIO
 
-def export_plan_to_pdf(plan):
-    """Export plan to PDF format"""
-    buffer = BytesIO()
+def export_plan_to_pdf(plan, buffer=None):
+    """Export plan to PDF format (bytes, or written into `buffer` and rewound if one is given)"""
+    return_bytes = buffer is None
+    if return_bytes:
+        buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch, bottomMargin=0.5*inch)
     
     styles = getSampleStyleSheet()
@@ -84,7 +86,7 @@ def export_plan_to_pdf(plan):
     
     doc.build(story)
     buffer.seek(0)
-    return buffer.getvalue()
+    return buffer.getvalue() if return_bytes else buffer
 
 def export_plan_to_json(plan):
     """Export plan to JSON format"""
@@ -93,12 +95,12 @@ def export_plan_to_json(plan):
         'framework': plan.framework.to_dict() if plan.framework else None,
         'status': plan.status,
         'summary': plan.summary,
-        'created_at': plan.created_at.isoformat() if plan.created_at else None,
-        'completed_at': plan.completed_at.isoformat() if plan.completed_at else None,
+        'created_at': plan.created_at,
+        'completed_at': plan.completed_at,
         'responses': [r.to_dict() for r in plan.responses],
         'metadata': {
             'total_responses': len(plan.responses),
-            'exported_at': plan.updated_at.isoformat() if plan.updated_at else None
+            'exported_at': plan.updated_at
         }
     }
 
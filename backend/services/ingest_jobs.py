@@ -0,0 +1,89 @@
+"""
+Ingest Jobs Service - Runs document processing/embedding off the request thread
+"""
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from flask import current_app
+
+from config import Config
+from models import db, IngestJob
+from services.document_loader import get_document_loader
+
+# Embedding is mostly waiting on the embeddings API, so a small thread pool suffices
+_executor = ThreadPoolExecutor(max_workers=Config.INGEST_WORKERS, thread_name_prefix='ingest')
+
+# Job state lives in the database so any worker process can report it. Finished
+# jobs are purged after this long; queued and running jobs are kept until they end
+FINISHED_JOB_RETENTION = timedelta(hours=1)
+
+# Jobs run in the process that accepted the upload, so a restart or crash leaves them
+# queued/running for good. At startup those untouched for this long are marked failed
+STALE_JOB_TIMEOUT = timedelta(hours=1)
+
+
+def _set_job(job_id: str, **fields):
+    db.session.query(IngestJob).filter(IngestJob.jobId == job_id).update(fields)
+    db.session.commit()
+
+
+def _run(app, job_id: str, file_path: str, library_name: str, content_hash: Optional[str]):
+    with app.app_context():
+        try:
+            _set_job(job_id, status='running')
+            result = get_document_loader().process_and_store(
+                file_path, library_name=library_name, content_hash=content_hash
+            )
+            _set_job(job_id, status='completed', result=result)
+        except Exception as e:
+            db.session.rollback()
+            _set_job(job_id, status='failed', error=f'Error processing document: {str(e)}')
+        finally:
+            # The upload's private directory is only needed until it has been processed
+            shutil.rmtree(os.path.dirname(file_path), ignore_errors=True)
+
+
+def submit_document(file_path: str, library_name: str, user_id: str,
+                    content_hash: Optional[str] = None) -> str:
+    """Queue an uploaded file for processing and return its job id.
+
+    file_path must sit in a directory of its own; the directory is removed once the job ends.
+    """
+    db.session.query(IngestJob).filter(
+        IngestJob.status.in_(('completed', 'failed')),
+        IngestJob.updated_at < datetime.utcnow() - FINISHED_JOB_RETENTION
+    ).delete(synchronize_session=False)
+    job = IngestJob(userId=user_id, status='queued', file=os.path.basename(file_path), library=library_name)
+    db.session.add(job)
+    db.session.commit()
+    _executor.submit(_run, current_app._get_current_object(), job.jobId, file_path, library_name, content_hash)
+    return job.jobId
+
+
+def fail_stale_jobs(upload_folder: str) -> int:
+    """Mark queued/running jobs abandoned by a previous process as failed and delete
+    upload directories older than STALE_JOB_TIMEOUT. Returns the number of jobs failed.
+    """
+    cutoff = datetime.utcnow() - STALE_JOB_TIMEOUT
+    failed = db.session.query(IngestJob).filter(
+        IngestJob.status.in_(('queued', 'running')),
+        IngestJob.updated_at < cutoff
+    ).update({'status': 'failed', 'error': 'Processing was interrupted by a server restart'},
+             synchronize_session=False)
+    db.session.commit()
+    # Each upload has a directory of its own (removed when its job ends), so any
+    # directory this old belongs to an interrupted job
+    with os.scandir(upload_folder) as entries:
+        for entry in entries:
+            if entry.is_dir() and datetime.utcfromtimestamp(entry.stat().st_mtime) < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+    return failed
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Get a job's status, or None if unknown/purged"""
+    job = db.session.get(IngestJob, job_id)
+    return job.to_dict() if job is not None else None
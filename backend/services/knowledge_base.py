@@ -2,170 +2,379 @@
 Knowledge Base Service - Provides RAG context from frameworks, controls, threats
 Enhanced with vector search for library documents
 """
+import io
+import re
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
-from models import Framework, Control, Threat, ControlMapping
-from services.document_loader import DocumentLoader
+from cachetools import TTLCache
+from rank_bm25 import BM25Okapi
+from sqlalchemy import event, text
+from sqlalchemy.orm import joinedload
+from models import db, GUID, Framework, Control, Threat, ControlMapping
+from services.document_loader import DocumentLoader, get_document_loader
+from services.tokens import truncate_to_tokens
+from config import Config
+
+# Full-text search over threats (name, description, category)
+# SQLite: external-content FTS5 table kept in sync with `threats` by triggers
+_SQLITE_THREAT_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS threat_fts USING fts5(
+        threatId UNINDEXED, name, description, category,
+        content='threats', content_rowid='rowid'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS threats_fts_ai AFTER INSERT ON threats BEGIN
+        INSERT INTO threat_fts(rowid, threatId, name, description, category)
+        VALUES (new.rowid, new.threatId, new.name, new.description, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS threats_fts_ad AFTER DELETE ON threats BEGIN
+        INSERT INTO threat_fts(threat_fts, rowid, threatId, name, description, category)
+        VALUES ('delete', old.rowid, old.threatId, old.name, old.description, old.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS threats_fts_au AFTER UPDATE ON threats BEGIN
+        INSERT INTO threat_fts(threat_fts, rowid, threatId, name, description, category)
+        VALUES ('delete', old.rowid, old.threatId, old.name, old.description, old.category);
+        INSERT INTO threat_fts(rowid, threatId, name, description, category)
+        VALUES (new.rowid, new.threatId, new.name, new.description, new.category);
+    END""",
+    "INSERT INTO threat_fts(threat_fts) VALUES ('rebuild')",
+]
+_SQLITE_THREAT_FTS_QUERY = "SELECT threatId FROM threat_fts WHERE threat_fts MATCH :q ORDER BY rank"
+
+# PostgreSQL: GIN index over the combined tsvector
+_PG_THREAT_TSVECTOR = (
+    "to_tsvector('english', coalesce(name, '') || ' ' || "
+    "coalesce(description, '') || ' ' || coalesce(category, ''))"
+)
+_PG_THREAT_FTS_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_threats_fts ON threats USING GIN ({_PG_THREAT_TSVECTOR})",
+]
+_PG_THREAT_FTS_QUERY = (
+    f'SELECT "threatId" FROM threats WHERE {_PG_THREAT_TSVECTOR} @@ plainto_tsquery(\'english\', :q)'
+)
+
+
+# Recently built question contexts (vector search + keyword lookups), keyed by
+# (question, use_vector_search, max_tokens)
+_context_cache = TTLCache(maxsize=1024, ttl=Config.KB_CONTEXT_CACHE_TTL)
+_context_cache_lock = threading.Lock()
+
+# Library vector searches run here, overlapping the BM25 ranking done on the request thread
+_search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='kb-search')
+
+# Hybrid retrieval: candidates taken from each ranking, and the RRF rank constant
+HYBRID_CANDIDATES = 20
+RRF_K = 60
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# BM25 index (and formatted entries) over controls/threats per database; dropped on catalog changes
+_bm25_cache = {}
+_bm25_cache_lock = threading.Lock()
+
+
+def _tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[str]:
+    """Fuse ranked lists: score(item) = sum of 1 / (k + rank) over the lists it appears in"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+# Formatted get_knowledge_summary() text per database; dropped whenever catalog rows change
+_knowledge_cache = TTLCache(maxsize=8, ttl=300)
+
+# Token budget of the fallback summary used when nothing matches a question
+SUMMARY_MAX_TOKENS = 750
+_knowledge_cache_lock = threading.Lock()
 
 
 class KnowledgeBase:
     """Retrieval-Augmented Generation knowledge base for cybersecurity frameworks"""
     
     _document_loader: Optional[DocumentLoader] = None
+    # Whether the threat vector index reflects the catalog; cleared by invalidate()
+    _threats_indexed: bool = False
+    
+    # Maximum cosine distance for a threat to count as a semantic match
+    THREAT_MATCH_MAX_DISTANCE = 0.3
     
     @classmethod
     def _get_document_loader(cls) -> DocumentLoader:
         """Lazy initialization of document loader"""
         if cls._document_loader is None:
             try:
-                cls._document_loader = DocumentLoader()
+                cls._document_loader = get_document_loader()
             except Exception as e:
                 print(f"Warning: Could not initialize document loader: {e}")
                 cls._document_loader = None
         return cls._document_loader
 
     @staticmethod
-    def get_all_knowledge() -> str:
-        """Get all knowledge as formatted text for RAG context"""
-        parts = []
-
-        # Frameworks overview
-        frameworks = Framework.query.all()
-        parts.append("=== CYBERSECURITY FRAMEWORKS ===\n")
-        for fw in frameworks:
-            parts.append(f"Framework: {fw.name} ({fw.type})\n")
-            parts.append(f"Description: {fw.description or 'N/A'}\n")
-            parts.append(f"Version: {fw.version or 'N/A'}\n\n")
-
-        # Controls from all frameworks
-        parts.append("=== CONTROLS ===\n")
-        controls = Control.query.order_by(Control.frameworkId, Control.reference).all()
-        for ctrl in controls:
-            fw = Framework.query.get(ctrl.frameworkId)
-            parts.append(f"Control: {ctrl.reference} - {ctrl.title}\n")
-            parts.append(f"Framework: {fw.name if fw else 'Unknown'}\n")
-            parts.append(f"Category: {ctrl.category or 'N/A'}\n")
-            parts.append(f"Description: {ctrl.description or 'N/A'}\n")
-            parts.append(f"Maturity/Cost: {ctrl.maturity_cost}/5, Severity Mitigated: {ctrl.severity_mitigated}/5\n\n")
-
-        # Threats
-        parts.append("=== THREAT LIBRARY ===\n")
-        threats = Threat.query.all()
-        for t in threats:
-            parts.append(f"Threat: {t.name}\n")
-            parts.append(f"Category: {t.category or 'N/A'}\n")
-            parts.append(f"Description: {t.description or 'N/A'}\n")
-            parts.append(f"Likelihood: {t.likelihood}/5, Impact: {t.impact}/5\n")
-
-            # Related controls
-            mappings = ControlMapping.query.filter_by(threatId=t.threatId).all()
-            if mappings:
-                parts.append("Recommended Controls:\n")
-                for m in mappings:
-                    c = m.control
-                    if c:
-                        parts.append(f"  - {c.reference} ({c.title}): {m.evidence_hint or 'See control description'}\n")
-            parts.append("\n")
-
-        return "\n".join(parts)
+    def ensure_threat_search_index() -> None:
+        """Create the full-text search index over threats for the current database dialect"""
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite':
+            statements = _SQLITE_THREAT_FTS_DDL
+        elif dialect == 'postgresql':
+            statements = _PG_THREAT_FTS_DDL
+        else:
+            return
+        try:
+            for statement in statements:
+                db.session.execute(text(statement))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Warning: Could not create threat search index: {e}")
 
     @staticmethod
-    def search_knowledge(query: str) -> str:
-        """Search knowledge base for relevant information (simple keyword matching)"""
-        query_lower = query.lower()
-        results = []
+    def keyword_search_threats(query: str) -> List[Threat]:
+        """Find threats matching all query words using the full-text index (ILIKE elsewhere)"""
+        dialect = db.engine.dialect.name
+        try:
+            if dialect == 'sqlite':
+                words = re.findall(r'\w+', query)
+                if not words:
+                    return []
+                # Quote each word (FTS5 syntax-safe) and prefix-match it
+                fts_query = " ".join('"' + w.replace('"', '""') + '"*' for w in words)
+                rows = db.session.execute(
+                    text(_SQLITE_THREAT_FTS_QUERY).columns(threatId=GUID()), {"q": fts_query}
+                ).fetchall()
+            elif dialect == 'postgresql':
+                rows = db.session.execute(
+                    text(_PG_THREAT_FTS_QUERY).columns(threatId=GUID()), {"q": query}
+                ).fetchall()
+            else:
+                rows = None
+        except Exception as e:
+            db.session.rollback()
+            print(f"Threat full-text search error: {e}")
+            rows = None
 
-        # Search frameworks
-        frameworks = Framework.query.filter(
-            (Framework.name.ilike(f'%{query}%')) |
-            (Framework.description.ilike(f'%{query}%'))
-        ).all()
-        if frameworks:
-            results.append("=== RELEVANT FRAMEWORKS ===\n")
-            for fw in frameworks:
-                results.append(f"{fw.name}: {fw.description}\n")
-
-        # Search controls
-        controls = Control.query.filter(
-            (Control.title.ilike(f'%{query}%')) |
-            (Control.description.ilike(f'%{query}%')) |
-            (Control.reference.ilike(f'%{query}%')) |
-            (Control.category.ilike(f'%{query}%'))
-        ).all()
-        if controls:
-            results.append("\n=== RELEVANT CONTROLS ===\n")
-            for c in controls:
-                fw = Framework.query.get(c.frameworkId)
-                results.append(f"{c.reference} ({fw.name if fw else 'Unknown'}): {c.title}\n")
-                if c.description:
-                    results.append(f"  {c.description}\n")
-
-        # Search threats
-        threats = Threat.query.filter(
-            (Threat.name.ilike(f'%{query}%')) |
-            (Threat.description.ilike(f'%{query}%')) |
-            (Threat.category.ilike(f'%{query}%'))
+        if rows is not None:
+            threat_ids = [row[0] for row in rows]
+            if not threat_ids:
+                return []
+            threats_by_id = {
+                t.threatId: t for t in Threat.query.filter(Threat.threatId.in_(threat_ids)).all()
+            }
+            return [threats_by_id[tid] for tid in threat_ids if tid in threats_by_id]
+
+        query_lower = query.lower()
+        return Threat.query.filter(
+            (Threat.name.ilike(f'%{query_lower}%')) |
+            (Threat.description.ilike(f'%{query_lower}%')) |
+            (Threat.category.ilike(f'%{query_lower}%'))
         ).all()
-        if threats:
-            results.append("\n=== RELEVANT THREATS ===\n")
-            for t in threats:
-                results.append(f"{t.name} ({t.category}): {t.description}\n")
 
-        return "\n".join(results) if results else "No specific matches found in knowledge base."
+    @classmethod
+    def search_threats(cls, query: str, n_results: int = 10) -> List[Threat]:
+        """Find threats relevant to a query via the threat vector index.
 
-    @staticmethod
-    def get_context_for_question(question: str, use_vector_search: bool = True) -> str:
-        """Get relevant context for a user question using keyword extraction and vector search"""
-        context_parts = []
-        
-        # 1. Vector search in library documents (if available)
-        if use_vector_search:
+        Falls back to full-text keyword matching when vector search is unavailable.
+        """
+        doc_loader = cls._get_document_loader()
+        if doc_loader:
             try:
-                doc_loader = KnowledgeBase._get_document_loader()
-                if doc_loader:
-                    vector_results = doc_loader.search(query=question, n_results=3)
-                    if vector_results:
-                        context_parts.append("=== RELEVANT LIBRARY DOCUMENTATION ===\n")
-                        for result in vector_results:
-                            source = result['metadata'].get('source', 'Unknown')
-                            library = result['metadata'].get('library', 'default')
-                            context_parts.append(f"[From {library}/{source}]\n{result['content']}\n\n")
+                if not cls._threats_indexed:
+                    # Set first, so a catalog change while indexing triggers another pass
+                    cls._threats_indexed = True
+                    try:
+                        doc_loader.index_threats(Threat.query.all())
+                    except Exception:
+                        cls._threats_indexed = False
+                        raise
+                matches = doc_loader.search_threats(query, n_results=n_results)
+                threat_ids = [
+                    m['threatId'] for m in matches
+                    if m['distance'] is None or m['distance'] <= cls.THREAT_MATCH_MAX_DISTANCE
+                ]
+                if not threat_ids:
+                    return []
+                threats_by_id = {
+                    t.threatId: t for t in Threat.query.filter(Threat.threatId.in_(threat_ids)).all()
+                }
+                return [threats_by_id[tid] for tid in threat_ids if tid in threats_by_id]
             except Exception as e:
-                print(f"Vector search error: {e}")
-        
-        # 2. Traditional keyword-based search in frameworks/controls/threats
-        keywords = []
-        q_lower = question.lower()
-
-        # Framework names
-        framework_names = ['nist csf', 'nist cs', 'iso 27001', 'iso27001', 'nist ai rmf', 'mitre atlas', 'atlas']
-        for fw_name in framework_names:
-            if fw_name in q_lower:
-                keywords.append(fw_name)
-
-        # Common threat terms
-        threat_terms = ['phishing', 'poisoning', 'adversarial', 'attack', 'threat', 'risk', 'vulnerability']
-        for term in threat_terms:
-            if term in q_lower:
-                keywords.append(term)
-
-        # Control/security terms
-        control_terms = ['control', 'compliance', 'audit', 'access', 'encryption', 'monitoring']
-        for term in control_terms:
-            if term in q_lower:
-                keywords.append(term)
-
-        # If specific keywords found, search; otherwise return general context
-        if keywords:
-            kb_context = KnowledgeBase.search_knowledge(" ".join(keywords))
-            if kb_context:
-                context_parts.append("=== CYBERSECURITY FRAMEWORK KNOWLEDGE ===\n")
-                context_parts.append(kb_context)
+                print(f"Threat vector search error: {e}")
+
+        return KnowledgeBase.keyword_search_threats(query)
+
+    @staticmethod
+    def get_knowledge_summary() -> str:
+        """Get a compact catalog overview (frameworks, control references, threat names)
+
+        Trimmed to SUMMARY_MAX_TOKENS tokens and cached until the catalog changes.
+        """
+        key = (str(db.engine.url), 'summary')
+        with _knowledge_cache_lock:
+            summary = _knowledge_cache.get(key)
+        if summary is None:
+            summary = truncate_to_tokens(KnowledgeBase._build_knowledge_summary(), SUMMARY_MAX_TOKENS)
+            with _knowledge_cache_lock:
+                _knowledge_cache[key] = summary
+        return summary
+
+    @staticmethod
+    def _build_knowledge_summary() -> str:
+        buf = io.StringIO()
+        write = buf.write
+        frameworks = Framework.query.order_by(Framework.name).all()
+        refs_by_framework = defaultdict(list)
+        for framework_id, reference in db.session.execute(
+            db.select(Control.frameworkId, Control.reference).order_by(Control.frameworkId, Control.reference)
+        ):
+            refs_by_framework[framework_id].append(reference)
+        write("Frameworks:\n")
+        for fw in frameworks:
+            refs = refs_by_framework.get(fw.frameworkId)
+            write(f"- {fw.name} ({fw.type})" + (f": {', '.join(refs)}\n" if refs else "\n"))
+        threat_names = db.session.scalars(db.select(Threat.name).order_by(Threat.name)).all()
+        if threat_names:
+            write(f"\nThreats: {', '.join(threat_names)}\n")
+        return buf.getvalue()
+
+    @classmethod
+    def invalidate(cls):
+        """Drop cached knowledge text and question contexts (frameworks/controls/threats changed)
+
+        Threats are also re-embedded into the threat vector index on the next search_threats.
+        """
+        cls._threats_indexed = False
+        with _knowledge_cache_lock:
+            _knowledge_cache.clear()
+        with _context_cache_lock:
+            _context_cache.clear()
+        with _bm25_cache_lock:
+            _bm25_cache.clear()
+
+    @staticmethod
+    def get_context_for_question(question: str, use_vector_search: bool = True,
+                                 max_tokens: Optional[int] = None) -> str:
+        """Get relevant context for a user question (cached briefly per question and options)"""
+        key = (question, use_vector_search, max_tokens)
+        with _context_cache_lock:
+            context = _context_cache.get(key)
+        if context is None:
+            context = KnowledgeBase._build_context_for_question(question, use_vector_search, max_tokens)
+            with _context_cache_lock:
+                _context_cache[key] = context
+        return context
+
+    @staticmethod
+    def _build_context_for_question(question: str, use_vector_search: bool = True,
+                                    max_tokens: Optional[int] = None) -> str:
+        """Build relevant context for a user question with hybrid retrieval
+
+        Library chunks (vector search) and controls/threats (BM25) are ranked
+        separately and fused with reciprocal rank fusion; the top HYBRID_TOP_K hits
+        form the context. If max_tokens is given, fewer hits are kept and the result
+        is cut on a token boundary.
+        """
+        top_k = Config.HYBRID_TOP_K
+        if max_tokens is not None:
+            # Don't keep more hits than the budget can hold
+            chunk_tokens = max(1, Config.CHUNK_SIZE // 4)
+            top_k = max(1, min(top_k, max_tokens // chunk_tokens))
+
+        # 1. Dense ranking: vector search in library documents (if available), run on a
+        # worker thread while BM25 ranks the catalog here (it needs this thread's session)
+        library_future = _search_executor.submit(KnowledgeBase._library_hits, question) if use_vector_search else None
+
+        # 2. Sparse ranking: BM25 over framework controls and threats
+        catalog_hits = KnowledgeBase.bm25_search(question, HYBRID_CANDIDATES)
+
+        library_hits = library_future.result() if library_future else []
+        hits = _reciprocal_rank_fusion([library_hits, catalog_hits])[:top_k]
+        if hits:
+            context = "=== RELEVANT KNOWLEDGE ===\n\n" + "\n".join(hits)
         else:
-            # Return summary of all knowledge (truncated for efficiency)
-            all_knowledge = KnowledgeBase.get_all_knowledge()
-            # Limit to first 3000 chars to avoid token limits
-            context_parts.append("=== CYBERSECURITY FRAMEWORK KNOWLEDGE (Summary) ===\n")
-            context_parts.append(all_knowledge[:3000])
-        
-        return "\n".join(context_parts) if context_parts else "No relevant context found."
+            # Nothing matched: return the precomputed catalog overview
+            context = "=== CYBERSECURITY FRAMEWORK KNOWLEDGE (Summary) ===\n\n" + KnowledgeBase.get_knowledge_summary()
+
+        if max_tokens is not None:
+            context = truncate_to_tokens(context, max_tokens)
+        return context
+
+    @staticmethod
+    def _library_hits(question: str) -> List[str]:
+        """Vector search over library documents, best first (formatted chunks; [] if unavailable)"""
+        library_hits = []
+        try:
+            doc_loader = KnowledgeBase._get_document_loader()
+            if doc_loader:
+                for result in doc_loader.search(query=question, n_results=HYBRID_CANDIDATES):
+                    source = result['metadata'].get('source', 'Unknown')
+                    library = result['metadata'].get('library', 'default')
+                    library_hits.append(f"[From {library}/{source}]\n{result['content']}\n")
+        except Exception as e:
+            print(f"Vector search error: {e}")
+        return library_hits
+
+    @staticmethod
+    def bm25_search(query: str, n_results: int = 20) -> List[str]:
+        """Rank controls and threats against the query with BM25, best first (formatted entries)"""
+        index = KnowledgeBase._get_bm25_index()
+        if index is None:
+            return []
+        bm25, entries = index
+        tokens = _tokenize(query)
+        if not tokens:
+            return []
+        scores = bm25.get_scores(tokens)
+        ranked = sorted(range(len(entries)), key=lambda i: scores[i], reverse=True)
+        return [entries[i] for i in ranked[:n_results] if scores[i] > 0]
+
+    @staticmethod
+    def _get_bm25_index():
+        """BM25 index over controls and threats for the current database, built once (None if empty)"""
+        key = str(db.engine.url)
+        with _bm25_cache_lock:
+            if key in _bm25_cache:
+                return _bm25_cache[key]
+        index = KnowledgeBase._build_bm25_index()
+        with _bm25_cache_lock:
+            _bm25_cache[key] = index
+        return index
+
+    @staticmethod
+    def _build_bm25_index():
+        corpus, entries = [], []
+        fw_names = {fw.frameworkId: fw.name for fw in Framework.query.all()}
+        for c in Control.query.order_by(Control.frameworkId, Control.reference):
+            fw_name = fw_names.get(c.frameworkId, 'Unknown')
+            corpus.append(_tokenize(f"{c.reference} {c.title} {c.description or ''} {c.category or ''} {fw_name}"))
+            entries.append(
+                f"Control: {c.reference} ({fw_name}): {c.title}\n"
+                + (f"  {c.description}\n" if c.description else "")
+            )
+        controls_by_threat = defaultdict(list)
+        for m in ControlMapping.query.options(joinedload(ControlMapping.control)):
+            if m.control:
+                controls_by_threat[m.threatId].append(m.control.reference)
+        for t in Threat.query.order_by(Threat.name):
+            corpus.append(_tokenize(f"{t.name} {t.description or ''} {t.category or ''}"))
+            recommended = controls_by_threat.get(t.threatId)
+            entries.append(
+                f"Threat: {t.name} ({t.category}): {t.description}\n"
+                + (f"  Recommended controls: {', '.join(recommended)}\n" if recommended else "")
+            )
+        if not corpus:
+            return None
+        return BM25Okapi(corpus), entries
+
+def _invalidate_knowledge(mapper, connection, target):
+    KnowledgeBase.invalidate()
+
 
+for _model in (Framework, Control, Threat, ControlMapping):
+    for _event in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event, _invalidate_knowledge)
@@ -0,0 +1,129 @@
+"""
+LLM Response Cache - Reuses generated text for identical or near-identical prompts
+Exact matches are looked up by hash; otherwise by embedding cosine similarity,
+only among entries stored under the same scope (e.g. the owning plan)
+"""
+import hashlib
+import threading
+import time
+from typing import Callable, Hashable, List, Optional, Tuple
+
+import numpy as np
+from cachetools import TTLCache
+
+from config import Config
+
+
+class SemanticCache:
+    """In-process cache of LLM outputs keyed by an exact hash and by prompt embedding"""
+
+    def __init__(self, threshold: float, ttl: int, maxsize: int):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._exact = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Parallel arrays: unit-normalized embeddings (one row each), outputs, scopes, insert times
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._values: List[str] = []
+        self._scopes: List[Hashable] = []
+        self._stored_at: List[float] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """SHA-256 of the repr of the given parts (callers pass already-sorted data)"""
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+    def _expire(self, now: float):
+        """Drop semantic entries older than the TTL (oldest are at the front)"""
+        expired = 0
+        while expired < len(self._stored_at) and now - self._stored_at[expired] > self.ttl:
+            expired += 1
+        if expired:
+            self._vectors = self._vectors[expired:]
+            del self._values[:expired]
+            del self._scopes[:expired]
+            del self._stored_at[:expired]
+
+    def get(self, key: str, embedding: Optional[np.ndarray] = None, scope: Hashable = None) -> Optional[str]:
+        """Return a cached output for the key, else for the most similar embedding
+        stored under the same scope, if above the threshold"""
+        with self._lock:
+            value = self._exact.get(key)
+            if value is not None or embedding is None:
+                return value
+            self._expire(time.monotonic())
+            candidates = [i for i, entry_scope in enumerate(self._scopes) if entry_scope == scope]
+            if not candidates:
+                return None
+            scores = self._vectors[candidates] @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                return self._values[candidates[best]]
+            return None
+
+    def put(self, key: str, value: str, embedding: Optional[np.ndarray] = None, scope: Hashable = None):
+        """Store an output under the key (and its embedding, if given, under the scope)"""
+        with self._lock:
+            self._exact[key] = value
+            if embedding is None:
+                return
+            now = time.monotonic()
+            self._expire(now)
+            rows = [self._vectors, embedding[np.newaxis, :]] if self._values else [embedding[np.newaxis, :]]
+            # Keep the newest maxsize entries
+            self._vectors = np.vstack(rows)[-self.maxsize:]
+            self._values = (self._values + [value])[-self.maxsize:]
+            self._scopes = (self._scopes + [scope])[-self.maxsize:]
+            self._stored_at = (self._stored_at + [now])[-self.maxsize:]
+
+    def clear(self):
+        with self._lock:
+            self._exact.clear()
+            self._vectors = np.empty((0, 0), dtype=np.float32)
+            self._values = []
+            self._scopes = []
+            self._stored_at = []
+
+    def lookup(self, key: str, text: str, scope: Hashable = None) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Return (cached output or None, embedding of text to pass to put() on a miss).
+
+        `text` is embedded only on an exact-key miss and compared only with entries
+        of the same scope; if embeddings are unavailable the cache falls back to
+        exact matches only. Keys of scoped entries should include the scope.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value, None
+        embedding = _embed(text)
+        if embedding is None:
+            return None, None
+        return self.get(key, embedding, scope), embedding
+
+    def get_or_compute(self, key: str, text: str, compute: Callable[[], str], scope: Hashable = None) -> str:
+        """Return the cached output for key/text within scope, or compute, store and return it"""
+        value, embedding = self.lookup(key, text, scope)
+        if value is None:
+            value = compute()
+            self.put(key, value, embedding, scope)
+        return value
+
+
+def _embed(text: str) -> Optional[np.ndarray]:
+    """Unit-normalized embedding of text with the document loader's model, or None if unavailable"""
+    try:
+        from services.document_loader import get_document_loader
+        vector = np.asarray(get_document_loader().embeddings.embed_query(text), dtype=np.float32)
+    except Exception as e:
+        print(f"Semantic cache embedding unavailable: {e}")
+        return None
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+# Shared cache for generated plan summaries (scoped per plan, never across users)
+plan_summary_cache = SemanticCache(
+    threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+    ttl=Config.SEMANTIC_CACHE_TTL,
+    maxsize=Config.SEMANTIC_CACHE_SIZE,
+)
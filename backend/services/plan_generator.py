@@ -2,9 +2,12 @@
 Plan Generator Service - LangChain-based, pluggable LLM providers
 Providers: OpenAI, Anthropic, Ollama (local)
 """
+import functools
 import requests
 from config import Config
 from models import ControlMapping, Threat, Control
+from sqlalchemy.orm import contains_eager, joinedload
+from services.llm_cache import plan_summary_cache
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
@@ -12,59 +15,56 @@ from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 from langchain_community.chat_models import ChatOllama
 
+# Threat name -> response keywords that cite it (naive inference from plan responses)
+_CITATION_KEYWORDS = {
+    'Phishing leading to credential theft': ('phishing',),
+    'Data poisoning (ML)': ('poison', 'poisoning'),
+}
+
+
 def _build_citations_section(plan):
     """Build a structured citations section using ontology mappings if threats are inferred from responses."""
-    # naive inference: look for keywords to map to threats
-    keywords = {
-        'phishing': 'Phishing leading to credential theft',
-        'poison': 'Data poisoning (ML)',
-        'poisoning': 'Data poisoning (ML)',
+    # One lowercased text per plan; keywords never contain a newline, so none can
+    # match across two responses. A threat stops being checked once one term hits.
+    text = "\n".join((r.value or '') for r in plan.responses).lower()
+    selected_threats = {
+        threat_name for threat_name, terms in _CITATION_KEYWORDS.items()
+        if any(term in text for term in terms)
     }
-    selected_threats = set()
-    for r in plan.responses:
-        text = (r.value or '').lower()
-        for k, threat_name in keywords.items():
-            if k in text:
-                selected_threats.add(threat_name)
 
     if not selected_threats:
         return []
 
+    # Matched threats with their mappings and controls in one query
+    mappings = ControlMapping.query.join(ControlMapping.threat).filter(
+        Threat.name.in_(selected_threats)
+    ).options(
+        contains_eager(ControlMapping.threat), joinedload(ControlMapping.control)
+    ).order_by(Threat.name).all()
     threat_rows = []
-    for name in selected_threats:
-        t = Threat.query.filter_by(name=name).first()
-        if not t:
-            continue
-        mappings = ControlMapping.query.filter_by(threatId=t.threatId).all()
-        for m in mappings:
-            c: Control = m.control
-            threat_rows.append({
-                'threat': t.to_dict(),
-                'control': c.to_dict() if c else None,
-                'evidence_hint': m.evidence_hint,
-            })
+    for m in mappings:
+        c: Control = m.control
+        threat_rows.append({
+            'threat': m.threat.to_dict(),
+            'control': c.to_dict() if c else None,
+            'evidence_hint': m.evidence_hint,
+        })
     return threat_rows
 
 
-def generate_plan_summary(plan, prompts, responses):
-    """
-    Generate a comprehensive cybersecurity plan summary using OpenAI
-    Based on user responses and the selected framework
-    """
-    if not client:
-        # Fallback if OpenAI API key not configured
-        return generate_fallback_summary(plan, prompts, responses)
-    
-    # Build context from responses
+def _pair_prompts_responses(prompts, responses):
+    """List of (prompt, response value) in prompt order ("Not answered" if missing)"""
     response_dict = {r.promptId: r.value for r in responses}
-    
+    return [(prompt, response_dict.get(prompt.promptId, "Not answered")) for prompt in prompts]
+
+
+def _build_plan_prompt(plan, pairs):
+    """Build (framework_name, responses_text, system_prompt, user_prompt) for the plan"""
     # Organize responses by prompt
-    responses_text = ""
-    for i, prompt in enumerate(prompts, 1):
-        response_value = response_dict.get(prompt.promptId, "Not answered")
-        responses_text += f"\n\nPrompt {i} ({prompt.category}):\n"
-        responses_text += f"Question: {prompt.text}\n"
-        responses_text += f"Response: {response_value}\n"
+    responses_text = "".join(
+        f"\n\nPrompt {i} ({prompt.category}):\nQuestion: {prompt.text}\nResponse: {response_value}\n"
+        for i, (prompt, response_value) in enumerate(pairs, 1)
+    )
     
     framework = plan.framework
     framework_name = framework.name if framework else "Selected Framework"
@@ -93,76 +93,163 @@ Please create a detailed cybersecurity plan that:
 
 Structure the plan with clear sections and subsections."""
 
-    try:
-        provider = (Config.LLM_PROVIDER or 'openai').lower()
+    return framework_name, responses_text, system_prompt, user_prompt
+
+
+@functools.lru_cache(maxsize=4)
+def _get_summary_chain(provider):
+    """Get the prompt | llm | parser chain for the provider (built once per process), or None if not configured"""
+    # Build a LangChain prompt
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "{system}"),
+        ("user", "{user}")
+    ])
+
+    # Select model
+    if provider == 'openai' and Config.OPENAI_API_KEY:
+        llm = ChatOpenAI(
+            api_key=Config.OPENAI_API_KEY,
+            model=Config.OPENAI_MODEL,
+            temperature=0.7,
+            max_tokens=3000,
+        )
+    elif provider == 'anthropic' and Config.ANTHROPIC_API_KEY:
+        llm = ChatAnthropic(
+            api_key=Config.ANTHROPIC_API_KEY,
+            model=Config.ANTHROPIC_MODEL,
+            temperature=0.7,
+            max_tokens=3000,
+        )
+    elif provider == 'ollama':
+        llm = ChatOllama(
+            base_url=Config.OLLAMA_BASE_URL,
+            model=Config.OLLAMA_MODEL,
+            temperature=0.7,
+        )
+    else:
+        return None
+
+    return prompt | llm | StrOutputParser()
+
 
-        # Build a LangChain prompt
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "{system}"),
-            ("user", "{user}")
-        ])
-
-        # Select model
-        if provider == 'openai' and Config.OPENAI_API_KEY:
-            llm = ChatOpenAI(
-                api_key=Config.OPENAI_API_KEY,
-                model=Config.OPENAI_MODEL,
-                temperature=0.7,
-                max_tokens=3000,
-            )
-        elif provider == 'anthropic' and Config.ANTHROPIC_API_KEY:
-            llm = ChatAnthropic(
-                api_key=Config.ANTHROPIC_API_KEY,
-                model=Config.ANTHROPIC_MODEL,
-                temperature=0.7,
-                max_tokens=3000,
-            )
-        elif provider == 'ollama':
-            llm = ChatOllama(
-                base_url=Config.OLLAMA_BASE_URL,
-                model=Config.OLLAMA_MODEL,
-                temperature=0.7,
-            )
-        else:
-            return generate_fallback_summary(plan, prompts, responses)
-
-        chain = prompt | llm | StrOutputParser()
-        generated_summary = chain.invoke({"system": system_prompt, "user": user_prompt})
-        
-        # Add framework metadata and citations
-        citations = _build_citations_section(plan)
-        citations_text = ""
-        if citations:
-            citations_text += "\n=== Framework Citations (Ontology-Driven) ===\n"
-            for idx, row in enumerate(citations, 1):
-                ctrl = row.get('control') or {}
-                threat = row.get('threat') or {}
-                citations_text += f"{idx}. Threat: {threat.get('name')} → Control: {ctrl.get('reference')} - {ctrl.get('title')}\n"
-                if row.get('evidence_hint'):
-                    citations_text += f"   Evidence: {row['evidence_hint']}\n"
-
-        summary_with_metadata = f"""=== Cybersecurity Plan Summary ===
+def _summary_cache_scope(plan):
+    """Summaries are only reused within the plan they were generated for (and so its owner)"""
+    return (str(plan.userId), str(plan.planId))
+
+
+def _summary_cache_key(provider, plan, responses):
+    return plan_summary_cache.make_key(
+        _summary_cache_scope(plan), provider, plan.frameworkId,
+        sorted((r.promptId, r.value or '') for r in responses)
+    )
+
+
+def _summary_header(plan, framework_name):
+    return f"""=== Cybersecurity Plan Summary ===
 Framework: {framework_name}
 Generated: {plan.created_at.strftime('%Y-%m-%d %H:%M:%S')}
 
-{generated_summary}
+"""
+
+
+def _summary_footer(plan, framework_name):
+    """Citations section and closing line appended after the generated text"""
+    # Add framework metadata and citations
+    citations = _build_citations_section(plan)
+    citations_text = ""
+    if citations:
+        citations_text += "\n=== Framework Citations (Ontology-Driven) ===\n"
+        for idx, row in enumerate(citations, 1):
+            ctrl = row.get('control') or {}
+            threat = row.get('threat') or {}
+            citations_text += f"{idx}. Threat: {threat.get('name')} → Control: {ctrl.get('reference')} - {ctrl.get('title')}\n"
+            if row.get('evidence_hint'):
+                citations_text += f"   Evidence: {row['evidence_hint']}\n"
+
+    return f"""
 
 {citations_text}
 ---
 This plan was generated using CyPlanAI based on {framework_name} framework."""
 
-        return summary_with_metadata
+
+def generate_plan_summary(plan, prompts, responses):
+    """
+    Generate a comprehensive cybersecurity plan summary using the configured LLM
+    Based on user responses and the selected framework
+    """
+    pairs = _pair_prompts_responses(prompts, responses)
+    framework_name, responses_text, system_prompt, user_prompt = _build_plan_prompt(plan, pairs)
+
+    try:
+        provider = (Config.LLM_PROVIDER or 'openai').lower()
+        chain = _get_summary_chain(provider)
+        if chain is None:
+            return generate_fallback_summary(plan, prompts, responses, pairs)
+
+        # Regenerating a plan with the same (or nearly the same) answers reuses its last LLM call
+        generated_summary = plan_summary_cache.get_or_compute(
+            _summary_cache_key(provider, plan, responses),
+            f"{provider}\n{framework_name}\n{responses_text}",
+            lambda: chain.invoke({"system": system_prompt, "user": user_prompt}),
+            scope=_summary_cache_scope(plan),
+        )
+
+        return _summary_header(plan, framework_name) + generated_summary + _summary_footer(plan, framework_name)
     
     except Exception as e:
-        print(f"Error generating plan with OpenAI: {e}")
-        return generate_fallback_summary(plan, prompts, responses)
+        print(f"Error generating plan with LLM: {e}")
+        return generate_fallback_summary(plan, prompts, responses, pairs)
+
+
+def stream_plan_summary(plan, prompts, responses):
+    """
+    Generate the same summary as generate_plan_summary, yielding it in pieces as
+    the LLM produces tokens (the concatenated pieces are the full summary)
+    """
+    pairs = _pair_prompts_responses(prompts, responses)
+    framework_name, responses_text, system_prompt, user_prompt = _build_plan_prompt(plan, pairs)
+    provider = (Config.LLM_PROVIDER or 'openai').lower()
+    try:
+        chain = _get_summary_chain(provider)
+    except Exception as e:
+        print(f"Error generating plan with LLM: {e}")
+        chain = None
+    if chain is None:
+        yield generate_fallback_summary(plan, prompts, responses, pairs)
+        return
 
-def generate_fallback_summary(plan, prompts, responses):
+    key = _summary_cache_key(provider, plan, responses)
+    scope = _summary_cache_scope(plan)
+    cached, embedding = plan_summary_cache.lookup(key, f"{provider}\n{framework_name}\n{responses_text}", scope)
+    if cached is not None:
+        yield _summary_header(plan, framework_name) + cached
+    else:
+        parts = []
+        try:
+            for chunk in chain.stream({"system": system_prompt, "user": user_prompt}):
+                if not parts:
+                    # Header goes out with the first token, so a failed call can still fall back
+                    yield _summary_header(plan, framework_name)
+                parts.append(chunk)
+                yield chunk
+        except Exception as e:
+            print(f"Error generating plan with LLM: {e}")
+            if parts:
+                # Part of the plan was already sent; let the caller discard it
+                raise
+            yield generate_fallback_summary(plan, prompts, responses, pairs)
+            return
+        plan_summary_cache.put(key, "".join(parts), embedding, scope)
+    yield _summary_footer(plan, framework_name)
+
+def generate_fallback_summary(plan, prompts, responses, pairs=None):
     """Generate a basic summary without AI when OpenAI is unavailable"""
     framework = plan.framework
     framework_name = framework.name if framework else "Selected Framework"
     
-    response_dict = {r.promptId: r.value for r in responses}
+    if pairs is None:
+        pairs = _pair_prompts_responses(prompts, responses)
     
     summary = f"""=== Cybersecurity Plan Summary ===
 Framework: {framework_name}
@@ -178,9 +265,10 @@ The plan addresses cybersecurity planning for the organization based on the sele
 === Key Responses Summary ===
 """
     
-    for i, prompt in enumerate(prompts, 1):
-        response_value = response_dict.get(prompt.promptId, "Not answered")
-        summary += f"\n{i}. {prompt.category}: {response_value[:200]}...\n"
+    summary += "".join(
+        f"\n{i}. {prompt.category}: {response_value[:200]}...\n"
+        for i, (prompt, response_value) in enumerate(pairs, 1)
+    )
     
     summary += f"""
 
@@ -10,7 +10,9 @@ def validate_response(value):
     if not value or not isinstance(value, str):
         return {'valid': False, 'message': 'Response value is required'}
     
-    value = value.strip()
+    # Only strip when an edge is whitespace; the limit applies to the stripped text
+    if value[0].isspace() or value[-1].isspace():
+        value = value.strip()
     
     if len(value) == 0:
         return {'valid': False, 'message': 'Response cannot be empty'}
@@ -0,0 +1,47 @@
+"""
+Token Service - Token counting and truncation for prompt budgets
+Uses the configured model's tiktoken encoding (cl100k_base if unknown)
+"""
+import functools
+import tiktoken
+
+from config import Config
+
+# Rough characters-per-token ratio used if no tokenizer can be loaded
+_APPROX_CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=1)
+def get_encoding():
+    """Get the tokenizer for the configured model, or None if unavailable"""
+    try:
+        return tiktoken.encoding_for_model(Config.OPENAI_MODEL)
+    except KeyError:
+        pass
+    except Exception as e:
+        print(f"Warning: Could not load tokenizer: {e}")
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Warning: Could not load tokenizer: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text"""
+    enc = get_encoding()
+    if enc is None:
+        return len(text) // _APPROX_CHARS_PER_TOKEN
+    return len(enc.encode(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Truncate text to at most max_tokens tokens, cutting on a token boundary"""
+    enc = get_encoding()
+    if enc is None:
+        return text[:max_tokens * _APPROX_CHARS_PER_TOKEN]
+    tokens = enc.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return enc.decode(tokens[:max_tokens])
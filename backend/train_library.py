@@ -2,9 +2,15 @@
 """
 Train documents from the library folder
 """
+import argparse
+import base64
+import json
 import os
 import sys
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 # Configuration
@@ -12,15 +18,31 @@ API_URL = "http://localhost:8088"
 LIBRARY_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "library")
 LIBRARY_NAME = "cybersecurity_frameworks"  # Knowledge base name
 
-def get_user_credentials():
-    """Get user credentials"""
+# Supported document types, parallel uploads, and timeouts (seconds) per upload request / processing job
+SUPPORTED_EXTENSIONS = {'.pdf', '.txt', '.md', '.markdown', '.docx'}
+UPLOAD_WORKERS = 4
+UPLOAD_TIMEOUT = 60
+JOB_TIMEOUT = 600
+JOB_POLL_INTERVAL = 2
+
+# Saved login reused across runs (until it expires or the server rejects it)
+TOKEN_CACHE_PATH = Path("~/.cyplanai/token").expanduser()
+TOKEN_EXPIRY_MARGIN = 60
+
+# One keep-alive connection pool for every API call (sized for the concurrent uploads and searches)
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+def get_user_credentials(email=None):
+    """Get user credentials (password from CYPLANAI_PASSWORD if set)"""
     print("=== Document Training System ===\n")
     print("Please ensure:")
     print("1. Flask API server is running (python3 app.py)")
     print("2. API keys are configured (DeepSeek or OpenAI)\n")
     
-    email = input("Enter your email: ").strip()
-    password = input("Enter your password: ").strip()
+    email = email or input("Enter your email: ").strip()
+    password = os.environ.get("CYPLANAI_PASSWORD") or input("Enter your password: ").strip()
     
     return email, password
 
@@ -28,7 +50,7 @@ def login(email, password):
     """Login and get JWT token"""
     print("\nLogging in...")
     try:
-        response = requests.post(f"{API_URL}/api/auth/login", json={
+        response = SESSION.post(f"{API_URL}/api/auth/login", json={
             "email": email,
             "password": password
         }, timeout=10)
@@ -48,62 +70,127 @@ def login(email, password):
         print(f"✗ Login error: {str(e)}")
         return None
 
+def _token_expiry(token):
+    """Return the JWT's `exp` claim (None if it has none); the signature is the server's to check"""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return claims.get("exp")
+    except Exception:
+        return None
+
+def load_saved_token(email=None):
+    """Return the saved token for API_URL (and email, if given) unless it is about to expire"""
+    try:
+        saved = json.loads(TOKEN_CACHE_PATH.read_text())
+    except (OSError, ValueError):
+        return None
+    if saved.get("api_url") != API_URL or (email and saved.get("email") != email):
+        return None
+    exp = saved.get("exp")
+    if exp is not None and exp <= time.time() + TOKEN_EXPIRY_MARGIN:
+        return None
+    return saved.get("token")
+
+def save_token(token, email):
+    """Save the token (readable by the current user only) for later runs"""
+    try:
+        TOKEN_CACHE_PATH.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd = os.open(TOKEN_CACHE_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"api_url": API_URL, "email": email, "token": token, "exp": _token_expiry(token)}, f)
+    except OSError as e:
+        print(f"Warning: Could not save login token: {e}")
+
+def _upload_file(headers, file_path, library_name):
+    """Upload one file and wait for its processing job; returns (result, error)"""
+    try:
+        with open(file_path, 'rb') as f:
+            response = SESSION.post(
+                f"{API_URL}/api/documents/upload",
+                headers=headers,
+                files={'file': (os.path.basename(file_path), f)},
+                data={'library_name': library_name},
+                timeout=UPLOAD_TIMEOUT
+            )
+        if response.status_code == 200:
+            # Identical file already in the library
+            return response.json().get('data', {}), None
+        if response.status_code != 202:
+            return None, response.json().get('error', 'Unknown error')
+        
+        job_id = response.json()['jobId']
+        deadline = time.monotonic() + JOB_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(JOB_POLL_INTERVAL)
+            job = SESSION.get(f"{API_URL}/api/documents/jobs/{job_id}", headers=headers, timeout=10).json()
+            if job.get('status') == 'completed':
+                return job.get('result', {}), None
+            if job.get('status') == 'failed':
+                return None, job.get('error', 'Processing failed')
+        return None, f'Processing did not finish within {JOB_TIMEOUT} seconds'
+    except Exception as e:
+        return None, str(e)
+
 def upload_directory(token, directory_path, library_name):
-    """Upload all documents from directory in batch"""
+    """Upload all documents from directory, one request per file (UPLOAD_WORKERS at a time)"""
     headers = {"Authorization": f"Bearer {token}"}
     
     print(f"Uploading directory: {directory_path}")
     print(f"Knowledge base name: {library_name}\n")
     
-    try:
-        response = requests.post(
-            f"{API_URL}/api/documents/upload-directory",
-            headers=headers,
-            json={
-                "directory_path": directory_path,
-                "library_name": library_name
-            },
-            timeout=300  # 5 minute timeout, processing large files may take time
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            successful = result.get('successful', 0)
-            failed = result.get('failed', 0)
-            
-            print(f"✓ Upload completed!")
-            print(f"  Successful: {successful} files")
-            print(f"  Failed: {failed} files")
-            
-            if result.get('errors'):
-                print("\nError details:")
-                for error in result['errors']:
-                    print(f"  - {error.get('file')}: {error.get('error')}")
-            
-            if result.get('results'):
-                print("\nProcessing results:")
-                for res in result['results']:
-                    print(f"  - {res.get('file')}: {res.get('chunks')} chunks")
-            
-            return True
-        else:
-            print(f"✗ Upload failed: {response.json().get('error', 'Unknown error')}")
-            return False
-    except Exception as e:
-        print(f"✗ Upload error: {str(e)}")
-        return False
+    files = [
+        os.path.join(root, name)
+        for root, _, names in os.walk(directory_path)
+        for name in names
+        if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS
+    ]
+    
+    # A slow or failing file only affects its own upload
+    results, errors = [], []
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        futures = {executor.submit(_upload_file, headers, path, library_name): path for path in files}
+        for i, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            result, error = future.result()
+            if error is None:
+                results.append(result)
+                print(f"  [{i}/{len(files)}] ✓ {os.path.basename(path)}")
+            else:
+                errors.append({'file': path, 'error': error})
+                print(f"  [{i}/{len(files)}] ✗ {os.path.basename(path)}")
+    
+    print(f"\n✓ Upload completed!")
+    print(f"  Successful: {len(results)} files")
+    print(f"  Failed: {len(errors)} files")
+    
+    if errors:
+        print("\nError details:")
+        for error in errors:
+            print(f"  - {error.get('file')}: {error.get('error')}")
+    
+    if results:
+        print("\nProcessing results:")
+        for res in results:
+            chunks = res.get('chunks')
+            print(f"  - {res.get('file')}: {f'{chunks} chunks' if chunks is not None else 'already processed'}")
+    
+    # Like the old single-request upload: fail only if nothing could be uploaded
+    return bool(results) or not files
 
 def list_libraries(token):
-    """List all libraries"""
+    """List all libraries (None if the token is rejected)"""
     headers = {"Authorization": f"Bearer {token}"}
     try:
-        response = requests.get(
+        response = SESSION.get(
             f"{API_URL}/api/documents/libraries",
             headers=headers,
             timeout=10
         )
         if response.status_code == 200:
             return response.json().get('libraries', [])
+        if response.status_code in (401, 422):
+            return None
         return []
     except:
         return []
@@ -118,18 +205,25 @@ def test_search(token, library_name):
     ]
     
     print("\n=== Testing Search Functionality ===")
-    for query in test_queries:
+    
+    def search(query):
+        return SESSION.post(
+            f"{API_URL}/api/documents/search",
+            headers=headers,
+            json={
+                "query": query,
+                "n_results": 3,
+                "library": library_name
+            },
+            timeout=10
+        )
+    
+    # Send the queries concurrently; report in the original order
+    with ThreadPoolExecutor(max_workers=len(test_queries)) as executor:
+        futures = [executor.submit(search, query) for query in test_queries]
+    for query, future in zip(test_queries, futures):
         try:
-            response = requests.post(
-                f"{API_URL}/api/documents/search",
-                headers=headers,
-                json={
-                    "query": query,
-                    "n_results": 3,
-                    "library": library_name
-                },
-                timeout=10
-            )
+            response = future.result()
             if response.status_code == 200:
                 results = response.json()
                 count = results.get('count', 0)
@@ -139,8 +233,21 @@ def test_search(token, library_name):
         except Exception as e:
             print(f"Query: '{query}' -> Error: {str(e)}")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train documents from the library folder via the API")
+    parser.add_argument("--yes", "-y", action="store_true",
+                        help="answer yes to every confirmation (no interactive prompts except credentials)")
+    parser.add_argument("--library-name", help=f"knowledge base name (default: {LIBRARY_NAME})")
+    parser.add_argument("--email", help="account email (password is read from CYPLANAI_PASSWORD if set)")
+    parser.add_argument("--login", action="store_true", help=f"log in again instead of reusing the token saved in {TOKEN_CACHE_PATH}")
+    parser.add_argument("--no-test-search", action="store_true", help="skip the test searches after training")
+    return parser.parse_args()
+
 def main():
     """Main function"""
+    args = parse_args()
+    library_name = args.library_name or LIBRARY_NAME
+    
     # Check if library folder exists
     if not os.path.isdir(LIBRARY_FOLDER):
         print(f"✗ Error: Library folder not found: {LIBRARY_FOLDER}")
@@ -152,7 +259,7 @@ def main():
     if not pdf_files:
         print(f"✗ Warning: No PDF files found in library folder")
         print(f"Folder path: {LIBRARY_FOLDER}")
-        response = input("Continue? (y/n): ").strip().lower()
+        response = 'y' if args.yes else input("Continue? (y/n): ").strip().lower()
         if response != 'y':
             sys.exit(0)
     else:
@@ -164,28 +271,36 @@ def main():
             print(f"  ... {len(pdf_files) - 5} more files")
         print()
     
-    # Get user credentials
-    email, password = get_user_credentials()
-    
-    # Login
-    token = login(email, password)
-    if not token:
-        sys.exit(1)
-    
-    # Show existing libraries
-    existing_libraries = list_libraries(token)
+    # Reuse the saved login while the server still accepts it
+    token = None if args.login else load_saved_token(args.email)
+    existing_libraries = list_libraries(token) if token else None
+    if existing_libraries is not None:
+        print("✓ Using saved login\n")
+    else:
+        # Get user credentials
+        email, password = get_user_credentials(args.email)
+        
+        # Login
+        token = login(email, password)
+        if not token:
+            sys.exit(1)
+        save_token(token, email)
+        
+        # Show existing libraries
+        existing_libraries = list_libraries(token)
     if existing_libraries:
         print(f"Existing knowledge bases: {', '.join(existing_libraries)}")
-        use_existing = input(f"\nUse existing library '{LIBRARY_NAME}'? (y/n, default y): ").strip().lower()
-        if use_existing == 'n':
-            LIBRARY_NAME = input("Enter new library name: ").strip() or "cybersecurity_frameworks"
+        if not args.yes and not args.library_name:
+            use_existing = input(f"\nUse existing library '{library_name}'? (y/n, default y): ").strip().lower()
+            if use_existing == 'n':
+                library_name = input("Enter new library name: ").strip() or LIBRARY_NAME
     print()
     
     # Upload documents
     print("=" * 50)
     print("Starting document training...")
     print("=" * 50)
-    success = upload_directory(token, LIBRARY_FOLDER, LIBRARY_NAME)
+    success = upload_directory(token, LIBRARY_FOLDER, library_name)
     
     if success:
         print("\n" + "=" * 50)
@@ -197,9 +312,14 @@ def main():
         print(f"\nCurrent knowledge bases: {', '.join(libraries) if libraries else 'None'}")
         
         # Test search
-        test_search_choice = input("\nTest search functionality? (y/n, default y): ").strip().lower()
+        if args.no_test_search:
+            test_search_choice = 'n'
+        elif args.yes:
+            test_search_choice = 'y'
+        else:
+            test_search_choice = input("\nTest search functionality? (y/n, default y): ").strip().lower()
         if test_search_choice != 'n':
-            test_search(token, LIBRARY_NAME)
+            test_search(token, library_name)
         
         print("\n✓ You can now ask questions in the AI agent, and the system will automatically use these documents to answer!")
         print("\nExample questions:")
@@ -2,8 +2,10 @@
 """
 Directly train documents from library folder (faster, no API needed)
 """
+import argparse
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 # Add project path
@@ -16,7 +18,14 @@ from services.document_loader import DocumentLoader
 LIBRARY_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "library")
 LIBRARY_NAME = "cybersecurity_frameworks"
 
-def train_documents():
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train documents from the library folder directly")
+    parser.add_argument("--yes", "-y", action="store_true", help="start without asking for confirmation")
+    parser.add_argument("--library-name", default=LIBRARY_NAME, help=f"knowledge base name (default: {LIBRARY_NAME})")
+    parser.add_argument("--no-test-search", action="store_true", help="skip the test searches after training")
+    return parser.parse_args()
+
+def train_documents(library_name=LIBRARY_NAME, assume_yes=False, test_search=True):
     """Train documents directly"""
     print("=" * 60)
     print("CyPlanAI Document Training System")
@@ -30,15 +39,19 @@ def train_documents():
         print(f"  Current working directory: {os.getcwd()}")
         sys.exit(1)
     
-    # List all supported files
+    # List all supported files in one directory pass (extensions matched in any case),
+    # skipping hidden/system files such as .DS_Store
     supported_extensions = {'.pdf', '.txt', '.md', '.markdown', '.docx'}
-    all_files = []
-    for ext in supported_extensions:
-        all_files.extend(Path(LIBRARY_FOLDER).glob(f"*{ext}"))
-        all_files.extend(Path(LIBRARY_FOLDER).glob(f"*{ext.upper()}"))
-    
-    # Filter out system files
-    all_files = [f for f in all_files if not f.name.startswith('.') and f.name != '.DS_Store']
+    with os.scandir(LIBRARY_FOLDER) as entries:
+        sized_files = [
+            (Path(entry.path), entry.stat().st_size) for entry in entries
+            if not entry.name.startswith('.')
+            and os.path.splitext(entry.name)[1].lower() in supported_extensions
+            and entry.is_file()
+        ]
+    # Largest first, so the biggest files don't start last and hold up the whole run
+    sized_files.sort(key=lambda item: item[1], reverse=True)
+    all_files = [file_path for file_path, _ in sized_files]
     
     if not all_files:
         print(f"✗ Error: No supported document files found in library folder")
@@ -48,14 +61,13 @@ def train_documents():
     
     print(f"✓ Found {len(all_files)} document files")
     print("\nFile list:")
-    for i, file_path in enumerate(all_files, 1):
-        size_mb = file_path.stat().st_size / (1024 * 1024)
-        print(f"  {i}. {file_path.name} ({size_mb:.2f} MB)")
+    for i, (file_path, size) in enumerate(sized_files, 1):
+        print(f"  {i}. {file_path.name} ({size / (1024 * 1024):.2f} MB)")
     print()
     
     # Confirm
-    print(f"Knowledge base name: {LIBRARY_NAME}")
-    confirm = input("\nStart training? (y/n, default y): ").strip().lower()
+    print(f"Knowledge base name: {library_name}")
+    confirm = 'y' if assume_yes else input("\nStart training? (y/n, default y): ").strip().lower()
     if confirm == 'n':
         print("Cancelled")
         sys.exit(0)
@@ -81,21 +93,26 @@ def train_documents():
             failed = 0
             total_chunks = 0
             
-            for i, file_path in enumerate(all_files, 1):
-                print(f"[{i}/{len(all_files)}] Processing: {file_path.name}")
-                try:
-                    result = doc_loader.process_and_store(
-                        str(file_path),
-                        library_name=LIBRARY_NAME
-                    )
-                    chunks = result.get('chunks', 0)
-                    total_chunks += chunks
-                    successful += 1
-                    print(f"  ✓ Success: {chunks} chunks, {result.get('total_chars', 0)} characters")
-                except Exception as e:
-                    failed += 1
-                    print(f"  ✗ Failed: {str(e)}")
-                print()
+            # Files are parsed and embedded concurrently; results are reported (and
+            # counted) here on the main thread as each one finishes
+            with ThreadPoolExecutor(max_workers=min(len(all_files), os.cpu_count() or 4)) as executor:
+                futures = {
+                    executor.submit(doc_loader.process_and_store, str(file_path), library_name=library_name): file_path
+                    for file_path in all_files
+                }
+                for i, future in enumerate(as_completed(futures), 1):
+                    file_path = futures[future]
+                    print(f"[{i}/{len(all_files)}] Processed: {file_path.name}")
+                    try:
+                        result = future.result()
+                        chunks = result.get('chunks', 0)
+                        total_chunks += chunks
+                        successful += 1
+                        print(f"  ✓ Success: {chunks} chunks, {result.get('total_chars', 0)} characters")
+                    except Exception as e:
+                        failed += 1
+                        print(f"  ✗ Failed: {str(e)}")
+                    print()
             
             # Summary
             print("=" * 60)
@@ -112,18 +129,24 @@ def train_documents():
             print()
             
             # Test search
-            print("=" * 60)
-            print("Testing search functionality...")
-            print("=" * 60)
-            test_queries = [
-                "NIST Cybersecurity Framework",
-                "ISO 27001",
-                "adversarial machine learning"
-            ]
-            
-            for query in test_queries:
+            if test_search:
+                print("=" * 60)
+                print("Testing search functionality...")
+                print("=" * 60)
+                test_queries = [
+                    "NIST Cybersecurity Framework",
+                    "ISO 27001",
+                    "adversarial machine learning"
+                ]
+                
+                # All test queries in one embeddings request and one vector query
                 try:
-                    results = doc_loader.search(query=query, n_results=2, library_filter=LIBRARY_NAME)
+                    results_by_query = doc_loader.batch_search(test_queries, n_results=2, library_filter=library_name)
+                except Exception as e:
+                    print(f"Test queries failed: {str(e)}")
+                    results_by_query = {}
+                
+                for query, results in results_by_query.items():
                     print(f"\nQuery: '{query}'")
                     print(f"Found {len(results)} results")
                     if results:
@@ -131,8 +154,6 @@ def train_documents():
                             source = result.get('metadata', {}).get('source', 'Unknown')
                             content_preview = result.get('content', '')[:100]
                             print(f"  {j}. [{source}] {content_preview}...")
-                except Exception as e:
-                    print(f"Query '{query}' failed: {str(e)}")
             
             print()
             print("=" * 60)
@@ -153,5 +174,6 @@ def train_documents():
             sys.exit(1)
 
 if __name__ == "__main__":
-    train_documents()
+    args = parse_args()
+    train_documents(library_name=args.library_name, assume_yes=args.yes, test_search=not args.no_test_search)
 